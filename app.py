@@ -1,448 +1,484 @@
-from flask import Flask, render_template_string, request, jsonify, g
+from flask import Flask, render_template, request, jsonify, g, abort, stream_with_context
 import sqlite3
 import os
+import io
+import csv
+import json
+import math
+import gzip
+import zlib
+import hashlib
+import base64
+import threading
+import queue
+import time
+import datetime
+import bisect
+import unicodedata
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él las respuestas se comprimen con gzip
+    brotli = None
 
 app = Flask(__name__)
 DATABASE = 'inventario.db'
+# Historial de existencias que build_index.py actualiza en cada build (ver /historial)
+HISTORIAL_DB = 'inventario_historial.db'
 
 # --- Configuración de Sucursales ---
 SUCURSALES_ORDEN = ['HI', 'EX', 'MT', 'SA', 'ADE']
+# Más 'Global' (la suma de todas): las que aceptan los filtros 'sucursal'
+SUCURSALES_BUSQUEDA = SUCURSALES_ORDEN + ['Global']
+
+def validar_sucursales(sucursales):
+    """Lanza ValueError si alguna de las sucursales pedidas no existe."""
+    invalidas = [s for s in sucursales if s not in SUCURSALES_BUSQUEDA]
+    if invalidas:
+        raise ValueError(f"Sucursal desconocida: {', '.join(invalidas)}")
 
 # --- Conexión a la Base de Datos ---
 
+# build_index.py publica cada build renombrando un archivo nuevo sobre DATABASE,
+# así que un cambio de inode/mtime significa que hay una generación nueva.
+# Aquí se guarda la firma del archivo y la generación que está sirviendo este worker.
+_db_actual = {'firma': None, 'generacion': 0, 'etag': None}
+
+def firma_db():
+    """(inode, mtime) del archivo de la DB publicada."""
+    st = os.stat(DATABASE)
+    return (st.st_ino, st.st_mtime_ns)
+
+def leer_build_info(db):
+    """(generación, fecha de construcción) guardadas por build_index.py en build_info."""
+    try:
+        row = db.execute("SELECT Generacion, Construido FROM build_info").fetchone()
+    except sqlite3.Error:
+        return 0, ''
+    return (row[0], row[1]) if row else (0, '')
+
+def generacion_actual():
+    """
+    Generación de la DB publicada. Solo hace un stat() por llamada; la tabla
+    build_info se vuelve a leer únicamente cuando cambia la firma del archivo.
+    """
+    try:
+        firma = firma_db()
+    except FileNotFoundError:
+        # No crear una DB vacía: sqlite3.connect la crearía si no existe
+        raise sqlite3.OperationalError(f"No existe la base de datos '{DATABASE}'")
+    if firma != _db_actual['firma']:
+        db = sqlite3.connect(f"file:{DATABASE}?mode=ro", uri=True)
+        try:
+            generacion, construido = leer_build_info(db)
+        finally:
+            db.close()
+        # La fecha de construcción distingue generaciones con el mismo número
+        # (por ejemplo si se borró la DB y se volvió a construir desde cero).
+        _db_actual['generacion'] = generacion
+        _db_actual['etag'] = f"g{generacion}-{hashlib.sha1(construido.encode()).hexdigest()[:8]}"
+        _db_actual['firma'] = firma
+        print(f"INFO: Usando la generación {_db_actual['generacion']} de '{DATABASE}'.")
+    return _db_actual['generacion']
+
+# Conexiones abiertas del worker, compartidas por todos sus hilos: cada petición
+# toma una libre al empezar (get_db) y la devuelve al terminar (devolver_db).
+# Así la caché de páginas de SQLite, el esquema ya leído y las sentencias
+# preparadas se reutilizan entre peticiones sin importar qué hilo las atienda,
+# y calentar() puede dejarlas listas antes de la primera petición. Las de una
+# firma anterior se cierran al sacarlas y se abre una nueva.
+DB_MMAP_BYTES = 256 * 1024 * 1024
+DB_CACHE_KIB = 64 * 1024
+DB_SENTENCIAS_CACHEADAS = 256
+
+_conexiones = queue.LifoQueue()  # (firma, conexión); LIFO: se reusan primero las más calientes
+
+def abrir_db():
+    """Conexión de solo lectura a DATABASE, ajustada para consultas cortas."""
+    # Sin immutable=1: build_index.py publica cada build con os.replace(), pero si
+    # algo llegara a escribir sobre el archivo mientras se lee, immutable haría que
+    # SQLite devolviera resultados erróneos o SQLITE_CORRUPT. Con mode=ro solo se
+    # paga un bloqueo compartido por consulta.
+    # check_same_thread=False: la conexión pasa de un hilo a otro entre
+    # peticiones, pero nunca la usan dos a la vez (ver tomar_conexion).
+    db = sqlite3.connect(f"file:{DATABASE}?mode=ro", uri=True, check_same_thread=False,
+                         cached_statements=DB_SENTENCIAS_CACHEADAS)
+    db.row_factory = sqlite3.Row # Permite acceder a los resultados por nombre de columna
+    db.execute(f"PRAGMA mmap_size = {DB_MMAP_BYTES}")
+    db.execute(f"PRAGMA cache_size = -{DB_CACHE_KIB}")
+    db.execute("PRAGMA query_only = 1")
+    return db
+
+def tomar_conexion():
+    """(firma, conexión) libre a la generación publicada; abre una si no hay."""
+    while True:
+        try:
+            firma, db = _conexiones.get_nowait()
+        except queue.Empty:
+            return _db_actual['firma'], abrir_db()
+        if firma == _db_actual['firma']:
+            return firma, db
+        db.close()  # De una generación anterior
+
 def get_db():
     db = getattr(g, '_database', None)
     if db is None:
-        db = g._database = sqlite3.connect(DATABASE)
-        db.row_factory = sqlite3.Row # Permite acceder a los resultados por nombre de columna
+        g._db_generacion = generacion_actual()
+        g._db_firma, db = tomar_conexion()
+        g._database = db
     return db
 
 @app.teardown_appcontext
-def close_connection(exception):
-    db = getattr(g, '_database', None)
+def devolver_db(exception):
+    # Con stream_with_context esto corre cuando termina de emitirse la respuesta
+    db = g.pop('_database', None)
     if db is not None:
-        db.close()
-
-# --- Plantilla HTML (con los cambios) ---
-
-HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html lang="es">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Ferretería El Cedro • Buscador de Inventario</title>
-    <style>
-        :root {
-            --color-primario: #00529B; /* Azul oscuro */
-            --color-fondo: #f4f7fa;
-            --color-tarjeta: #ffffff;
-            --color-texto: #333;
-            --color-borde: #dde3e8;
-            --color-sombra: rgba(0, 0, 0, 0.05);
-            --color-cabecera: #007BFF; /* Azul brillante */
-        }
-        body {
-            font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, "Helvetica Neue", Arial, sans-serif;
-            background-color: var(--color-fondo);
-            color: var(--color-texto);
-            margin: 0;
-            padding: 20px;
-        }
-        .container {
-            max-width: 900px;
-            margin: 20px auto;
-            background-color: var(--color-tarjeta);
-            border: 1px solid var(--color-borde);
-            border-radius: 10px;
-            box-shadow: 0 4px 12px var(--color-sombra);
-            overflow: hidden;
-        }
-        header {
-            background-color: var(--color-cabecera);
-            color: white;
-            padding: 20px;
-            text-align: center;
-        }
-        header h1 {
-            margin: 0;
-            font-size: 1.5em;
-        }
-        .search-box {
-            padding: 20px;
-            border-bottom: 1px solid var(--color-borde);
-            display: flex;
-            gap: 10px;
-        }
-        .search-box input[type="text"] {
-            flex-grow: 1;
-            padding: 12px 15px;
-            font-size: 1em;
-            border: 1px solid var(--color-borde);
-            border-radius: 6px;
-        }
-        .search-box button {
-            padding: 12px 20px;
-            font-size: 1em;
-            background-color: var(--color-primario);
-            color: white;
-            border: none;
-            border-radius: 6px;
-            cursor: pointer;
-            transition: background-color 0.2s;
-        }
-        .search-box button:hover {
-            background-color: #00417a;
-        }
-        .filters {
-            padding: 10px 20px;
-            background-color: #fafbfe;
-            border-bottom: 1px solid var(--color-borde);
-            font-size: 0.9em;
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            flex-wrap: wrap;
-        }
-        .filters label {
-            margin-right: 15px;
-            display: inline-block;
-            cursor: pointer;
-        }
-        .filters input[type="checkbox"] {
-            margin-right: 5px;
-        }
-        .detalle-producto {
-            padding: 20px;
-            border-bottom: 1px solid var(--color-borde);
-        }
-        .detalle-producto h3 {
-            margin-top: 0;
-            color: var(--color-primario);
-        }
-        .tabla-existencias {
-            width: 100%;
-            border-collapse: collapse;
-            text-align: center;
-        }
-        .tabla-existencias th, .tabla-existencias td {
-            padding: 10px;
-            border: 1px solid var(--color-borde);
-        }
-        .tabla-existencias thead {
-            background-color: var(--color-fondo);
-            font-size: 0.9em;
-        }
-        .tabla-existencias tbody td:first-child,
-        .tabla-existencias tbody td:nth-child(2) { /* Ajustado si Clasificacion se muestra */
-            text-align: left;
-            font-weight: bold;
-            font-size: 0.9em;
-            vertical-align: middle;
-        }
-        .tabla-existencias .existencia-val {
-            font-size: 1.2em;
-            font-weight: bold;
-        }
-        .existencia-negativa {
-            color: #D9534F; /* Rojo */
-        }
-        .search-results {
-            padding: 0;
-            margin: 0;
-            list-style-type: none;
-            max-height: 400px;
-            overflow-y: auto;
-        }
-        .search-results li {
-            padding: 15px 20px;
-            border-bottom: 1px solid var(--color-borde);
-            cursor: pointer;
-            transition: background-color 0.2s;
-        }
-        .search-results li:last-child {
-            border-bottom: none;
-        }
-        .search-results li:hover {
-            background-color: #f9f9f9;
-        }
-        .search-results li .codigo-aq {
-            font-weight: bold;
-            color: var(--color-primario);
-            display: block;
-            font-size: 0.9em;
-            margin-bottom: 3px;
-        }
-        .search-results li .codigo-b {
-            font-weight: bold;
-            color: #555;
-        }
-        .search-results li .desc-d {
-            color: #333;
-        }
-        .leyenda {
-            padding: 15px 20px;
-            font-size: 0.8em;
-            color: #777;
-            background-color: var(--color-fondo);
-            border-top: 1px solid var(--color-borde);
-        }
-        footer {
-            font-size: 0.8em;
-            text-align: center;
-            padding: 15px;
-            color: #aaa;
-            background-color: #fcfcfc;
-            border-top: 1px solid var(--color-borde);
-        }
-    </style>
-</head>
-<body>
-
-    <div class="container">
-        <header>
-            <h1>Ferretería El Cedro • Buscador de Inventario</h1>
-        </header>
-
-        <div class="search-box">
-            <input type="text" id="search-input" placeholder="Buscar por código (B, AQ) o descripción (D)..." autocomplete="off">
-            <button id="search-button">Buscar</button>
-        </div>
-
-        <div class="filters">
-            <div>
-                <strong>Filtrar por Sucursal:</strong>
-                {% for suc in SUCURSALES_ORDEN %}
-                <label><input type="checkbox" name="sucursal" value="{{ suc }}"> {{ suc }}</label>
-                {% endfor %}
-            </div>
-            <label><input type="checkbox" id="solo-con-existencia"> Solo con existencia</label>
-        </div>
-
-        <div class="detalle-producto" id="detalle-producto" style="display: none;">
-            </div>
-        
-        <div class="leyenda" id="leyenda-clasificacion" style="display: none;">
-            <strong>A:</strong> 6-12m vendidos | <strong>B:</strong> 3-5m vendidos | <strong>C:</strong> 1-2m vendidos | <strong>S/M:</strong> Sin Venta (>0)
-        </div>
+        _conexiones.put((g._db_firma, db))
 
-        <ul class="search-results" id="search-results">
-            </ul>
-        
-        <footer id="footer-info">
-            Hecho para uso interno – Inventario consolidado • Ferretería El Cedro
-        </footer>
-    </div>
-
-    <script>
-        // --- Variables Globales ---
-        const searchInput = document.getElementById('search-input');
-        const searchResults = document.getElementById('search-results');
-        const detalleProducto = document.getElementById('detalle-producto');
-        const leyendaClasificacion = document.getElementById('leyenda-clasificacion'); // <-- Re-agregado
-        const searchButton = document.getElementById('search-button');
-        const soloConExistencia = document.getElementById('solo-con-existencia');
-        const sucursalCheckboxes = document.querySelectorAll('input[name="sucursal"]');
-        let currentQuery = "";
-
-        // --- Lógica de Búsqueda ---
-        
-        async function fetchSearch(query) {
-            if (query.length < 2) {
-                searchResults.innerHTML = '';
-                return;
-            }
-            currentQuery = query;
-            try {
-                const response = await fetch(\`/search?q=\${encodeURIComponent(query)}\`);
-                const productos = await response.json();
-                displaySearchResults(productos);
-            } catch (error) {
-                console.error('Error en fetchSearch:', error);
-                searchResults.innerHTML = '<li>Error al cargar resultados.</li>';
-            }
-        }
+# --- Caché de Resultados ---
 
-        function displaySearchResults(productos) {
-            searchResults.innerHTML = '';
-            if (productos.length === 0) {
-                searchResults.innerHTML = '<li style="text-align: center; color: #777;">No se encontraron productos.</li>';
-                return;
-            }
-            
-            productos.forEach(producto => {
-                const li = document.createElement('li');
-                li.dataset.codigo = producto.Codigo;
-                
-                li.innerHTML = \`
-                    <span class="codigo-aq">(\${producto.DescProd2 || 'S/C'})</span>
-                    <span class="codigo-b">\${producto.Codigo}</span> – 
-                    <span class="desc-d">\${producto.Descripcion}</span>
-                \`;
-                
-                li.addEventListener('click', () => {
-                    fetchDetalle(producto.Codigo);
-                    searchResults.style.display = 'none';
-                    detalleProducto.style.display = 'block';
-                    leyendaClasificacion.style.display = 'block'; // <-- Re-agregado
-                    searchInput.value = producto.Codigo;
-                });
-                searchResults.appendChild(li);
-            });
-        }
-        
-        // --- Lógica de Detalles ---
-        
-        async function fetchDetalle(codigo) {
-            try {
-                const filtros = getFiltros();
-                const response = await fetch(\`/detalle?codigo=\${encodeURIComponent(codigo)}&\${filtros.query}\`);
-                const data = await response.json();
-                
-                if (data.error) {
-                    detalleProducto.innerHTML = \`<p style="color: red;">\${data.error}</p>\`;
-                    return;
-                }
-                
-                displayDetalleProducto(data, filtros.sucursales);
-                
-            } catch (error) {
-                console.error('Error en fetchDetalle:', error);
-                detalleProducto.innerHTML = '<p style="color: red;">Error al cargar el detalle del producto.</p>';
-            }
-        }
-        
-        function displayDetalleProducto(data, sucursalesFiltro) {
-            const sucursalesAMostrar = sucursalesFiltro.length > 0 ? sucursalesFiltro : {{ SUCURSALES_ORDEN | tojson }};
-            
-            let ths = '';
-            let tdsExistencia = '';
-            let tdsClasificacion = ''; // <-- Re-agregado
-            
-            sucursalesAMostrar.forEach(suc => {
-                const info = data.sucursales[suc] || { Existencia: 'N/A', Clasificacion: 'N/A' }; // <-- Re-agregado
-                let existenciaNum = parseInt(info.Existencia);
-                let existenciaStr = info.Existencia;
-                
-                let claseExistencia = '';
-                if (!isNaN(existenciaNum) && existenciaNum < 0) {
-                    claseExistencia = 'class="existencia-negativa"';
-                }
-
-                ths += \`<th>\${suc}</th>\`;
-                tdsExistencia += \`<td \${claseExistencia}>\${existenciaStr}</td>\`;
-                tdsClasificacion += \`<td>\${info.Clasificacion}</td>\`; // <-- Re-agregado
-            });
-            
-            let stockTotal = data.global.Existencia;
-            let stockTotalClase = parseInt(stockTotal) < 0 ? 'class="existencia-negativa"' : '';
-
-            // CAMBIO: Volver a agregar la fila de Clasificación
-            detalleProducto.innerHTML = \`
-                <h3>Detalle: \${data.global.Descripcion}</h3>
-                <p><strong>Código (B):</strong> \${data.codigo_buscado}</p>
-                <p><strong>Código (AQ):</strong> \${data.global.DescProd2 || 'S/C'}</p>
-                <table class="tabla-existencias">
-                    <thead>
-                        <tr>
-                            <th></th>
-                            \${ths}
-                            <th>Stock Total</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-                        <tr>
-                            <td><strong>EXISTENCIAS</strong></td>
-                            \${tdsExistencia}
-                            <td class="existencia-val \${stockTotalClase}">\${stockTotal}</td>
-                        </tr>
-                        <tr>
-                            <td><strong>CLASIFICACIÓN</strong></td>
-                            \${tdsClasificacion}
-                            <td>\${data.global.Clasificacion}</td>
-                        </tr>
-                    </tbody>
-                </table>
-            \`;
-            
-            detalleProducto.style.display = 'block';
-            leyendaClasificacion.style.display = 'block'; // <-- Re-agregado
-        }
+# Los datos solo cambian cuando build_index.py publica una generación nueva, así
+# que las respuestas de /search y /detalle se guardan en memoria (por worker)
+# hasta el siguiente build.
+CACHE_MAX_ENTRADAS = 5000
+CACHE_MAX_BYTES = 32 * 1024 * 1024
 
-        // --- Lógica de Filtros ---
-        
-        function getFiltros() {
-            const soloExistencia = soloConExistencia.checked;
-            const sucursales = Array.from(sucursalCheckboxes)
-                .filter(cb => cb.checked)
-                .map(cb => cb.value);
-            
-            let queryParts = [];
-            if (soloExistencia) {
-                queryParts.push('solo_existencia=true');
-            }
-            sucursales.forEach(suc => {
-                queryParts.push(\`sucursal=\${encodeURIComponent(suc)}\`);
-            });
-            
+class CacheLRU:
+    """
+    Caché LRU acotada por número de entradas y por bytes, ligada a una
+    generación de la DB: al cambiar la generación se vacía completa.
+    """
+
+    def __init__(self, max_entradas, max_bytes):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.entradas = OrderedDict()  # clave -> (valor, tamaño)
+        self.bytes = 0
+        self.generacion = None
+        self.hits = self.misses = self.evictions = self.invalidaciones = 0
+        self.lock = threading.Lock()
+
+    def _revisar_generacion(self, generacion):
+        if generacion != self.generacion:
+            if self.entradas:
+                self.invalidaciones += 1
+            self.entradas.clear()
+            self.bytes = 0
+            self.generacion = generacion
+
+    def get(self, clave, generacion):
+        with self.lock:
+            self._revisar_generacion(generacion)
+            entrada = self.entradas.get(clave)
+            if entrada is None:
+                self.misses += 1
+                return None
+            self.entradas.move_to_end(clave)
+            self.hits += 1
+            return entrada[0]
+
+    def put(self, clave, generacion, valor, tamano):
+        with self.lock:
+            self._revisar_generacion(generacion)
+            if tamano > self.max_bytes:
+                return
+            anterior = self.entradas.pop(clave, None)
+            if anterior is not None:
+                self.bytes -= anterior[1]
+            self.entradas[clave] = (valor, tamano)
+            self.bytes += tamano
+            while len(self.entradas) > self.max_entradas or self.bytes > self.max_bytes:
+                _, (_, liberado) = self.entradas.popitem(last=False)
+                self.bytes -= liberado
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
             return {
-                query: queryParts.join('&'),
-                sucursales: sucursales
-            };
-        }
-        
-        function applyFiltros() {
-            const codigoActual = searchInput.value;
-            if (detalleProducto.style.display === 'block' && codigoActual) {
-                fetchDetalle(codigoActual);
-            }
-        }
-        
-        // --- Event Listeners ---
-        
-        let searchTimeout;
-        searchInput.addEventListener('input', (e) => {
-            clearTimeout(searchTimeout);
-            if (e.target.value === '') {
-                searchResults.innerHTML = '';
-                detalleProducto.style.display = 'none';
-                leyendaClasificacion.style.display = 'none'; // <-- Re-agregado
-                searchResults.style.display = 'block';
-                return;
-            }
-            
-            if (searchResults.style.display === 'none') {
-                searchResults.style.display = 'block';
-                detalleProducto.style.display = 'none';
-                leyendaClasificacion.style.display = 'none'; // <-- Re-agregado
+                "generacion": self.generacion,
+                "entradas": len(self.entradas),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidaciones": self.invalidaciones,
             }
-            
-            searchTimeout = setTimeout(() => {
-                fetchSearch(e.target.value);
-            }, 300);
-        });
-
-        searchInput.addEventListener('keydown', (e) => {
-            if (e.key === 'Enter') {
-                clearTimeout(searchTimeout);
-                fetchSearch(searchInput.value);
-            }
-        });
-        
-        searchButton.addEventListener('click', () => {
-            clearTimeout(searchTimeout);
-            fetchSearch(searchInput.value);
-        });
 
-        soloConExistencia.addEventListener('change', applyFiltros);
-        sucursalCheckboxes.forEach(cb => {
-            cb.addEventListener('change', applyFiltros);
-        });
+cache_resultados = CacheLRU(CACHE_MAX_ENTRADAS, CACHE_MAX_BYTES)
+
+def respuesta_cacheada(clave, generar):
+    """
+    Devuelve la respuesta guardada para 'clave' en la generación actual, o la
+    genera con generar() y la guarda. Solo se guardan respuestas 200 y 404; los
+    errores de base de datos (500) siempre se recalculan.
+    """
+    try:
+        generacion = generacion_actual()
+    except sqlite3.Error:
+        return generar()  # Sin DB no hay nada que cachear; el endpoint responde el error
+
+    g.generacion_respuesta = generacion
+    guardada = cache_resultados.get(clave, generacion)
+    if guardada is not None:
+        cuerpo, status = guardada
+        return app.response_class(cuerpo, status=status, mimetype='application/json')
+
+    respuesta = app.make_response(generar())
+    if respuesta.status_code in (200, 404):
+        cuerpo = respuesta.get_data()
+        cache_resultados.put(clave, generacion, (cuerpo, respuesta.status_code), len(cuerpo) + len(repr(clave)))
+    return respuesta
 
-    </script>
-</body>
-</html>
-"""
+# --- Métricas ---
+
+# Histogramas y contadores en memoria de este worker, expuestos en /metrics con
+# el formato de texto de Prometheus. Cada observación es un bisect y una suma
+# bajo un lock, así que se pueden dejar activos en producción.
+LIMITES_SEGUNDOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+LIMITES_FILAS = (0, 1, 5, 10, 25, 50, 100, 200, 500, 1000)
+
+# Consultas que tarden más que esto se registran con su EXPLAIN QUERY PLAN
+CONSULTA_LENTA_MS = 100
+
+class Histograma:
+    def __init__(self, limites):
+        self.limites = limites
+        self.cubetas = [0] * (len(limites) + 1)  # la última es +Inf
+        self.suma = 0.0
+        self.cuenta = 0
+
+    def observar(self, valor):
+        self.cubetas[bisect.bisect_left(self.limites, valor)] += 1
+        self.suma += valor
+        self.cuenta += 1
+
+class Metricas:
+    """Registro de métricas con etiquetas; exposicion() genera el texto para Prometheus."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.familias = {}  # nombre -> (tipo, ayuda, límites, {etiquetas: valor o Histograma})
+
+    def histograma(self, nombre, ayuda, limites):
+        self.familias[nombre] = ('histogram', ayuda, limites, {})
+
+    def contador(self, nombre, ayuda):
+        self.familias[nombre] = ('counter', ayuda, None, {})
+
+    def observar(self, nombre, valor, **etiquetas):
+        _, _, limites, series = self.familias[nombre]
+        clave = tuple(sorted(etiquetas.items()))
+        with self.lock:
+            serie = series.get(clave)
+            if serie is None:
+                serie = series[clave] = Histograma(limites)
+            serie.observar(valor)
+
+    def contar(self, nombre, n=1, **etiquetas):
+        series = self.familias[nombre][3]
+        clave = tuple(sorted(etiquetas.items()))
+        with self.lock:
+            series[clave] = series.get(clave, 0) + n
+
+    def exposicion(self):
+        lineas = []
+        with self.lock:
+            for nombre, (tipo, ayuda, limites, series) in self.familias.items():
+                lineas.append(f"# HELP {nombre} {ayuda}")
+                lineas.append(f"# TYPE {nombre} {tipo}")
+                for clave, serie in series.items():
+                    if tipo == 'counter':
+                        lineas.append(f"{nombre}{etiquetas_prometheus(clave)} {serie}")
+                        continue
+                    acumulado = 0
+                    for limite, cubeta in zip(limites + (float('inf'),), serie.cubetas):
+                        acumulado += cubeta
+                        le = '+Inf' if limite == float('inf') else repr(limite)
+                        lineas.append(f"{nombre}_bucket{etiquetas_prometheus(clave + (('le', le),))} {acumulado}")
+                    lineas.append(f"{nombre}_sum{etiquetas_prometheus(clave)} {serie.suma!r}")
+                    lineas.append(f"{nombre}_count{etiquetas_prometheus(clave)} {serie.cuenta}")
+        return '\n'.join(lineas) + '\n'
+
+def etiquetas_prometheus(clave):
+    if not clave:
+        return ''
+    escapar = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escapar(v)}"' for k, v in clave) + '}'
+
+metricas = Metricas()
+metricas.histograma('inventario_peticion_segundos', "Duración de las peticiones HTTP por endpoint.", LIMITES_SEGUNDOS)
+metricas.contador('inventario_peticiones_total', "Peticiones HTTP por endpoint y código de respuesta.")
+metricas.histograma('inventario_consulta_segundos', "Duración de execute + fetch de cada consulta SQLite.", LIMITES_SEGUNDOS)
+metricas.histograma('inventario_consulta_filas', "Filas devueltas por cada consulta SQLite.", LIMITES_FILAS)
+metricas.contador('inventario_consultas_lentas_total', f"Consultas SQLite de más de {CONSULTA_LENTA_MS} ms.")
+metricas.contador('inventario_consulta_errores_total', "Errores de SQLite por consulta.")
+metricas.histograma('inventario_json_segundos', "Tiempo de serialización JSON de la respuesta.", LIMITES_SEGUNDOS)
+
+def consultar(cur, nombre, sql, params):
+    """
+    cur.execute(sql, params).fetchall() midiendo tiempo y filas bajo la etiqueta
+    'nombre'. Si tarda más de CONSULTA_LENTA_MS registra su plan de ejecución.
+    """
+    t0 = time.perf_counter()
+    try:
+        filas = cur.execute(sql, params).fetchall()
+    except sqlite3.Error:
+        metricas.contar('inventario_consulta_errores_total', consulta=nombre)
+        raise
+    duracion = time.perf_counter() - t0
+    metricas.observar('inventario_consulta_segundos', duracion, consulta=nombre)
+    metricas.observar('inventario_consulta_filas', len(filas), consulta=nombre)
+    if duracion * 1000 > CONSULTA_LENTA_MS:
+        metricas.contar('inventario_consultas_lentas_total', consulta=nombre)
+        registrar_consulta_lenta(getattr(cur, 'connection', cur), nombre, sql, params, duracion, len(filas))
+    return filas
+
+def registrar_consulta_lenta(conn, nombre, sql, params, duracion, n_filas):
+    try:
+        plan = [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+    except sqlite3.Error as e:
+        plan = [f"(no disponible: {e})"]
+    print(f"LENTA: consulta '{nombre}' tardó {duracion * 1000:.1f} ms y devolvió {n_filas} filas; params={params!r}")
+    for paso in plan:
+        print(f"   plan: {paso}")
+
+def jsonify_medido(nombre, data):
+    """jsonify() registrando el tiempo de serialización bajo 'nombre'."""
+    t0 = time.perf_counter()
+    respuesta = jsonify(data)
+    metricas.observar('inventario_json_segundos', time.perf_counter() - t0, endpoint=nombre)
+    return respuesta
+
+@app.before_request
+def iniciar_medicion():
+    g._inicio_peticion = time.perf_counter()
+
+# Se registra antes que validadores_y_compresion, y Flask corre los after_request
+# en orden inverso: el tiempo medido incluye la compresión. En respuestas por
+# streaming (/exportar, /detalle/lote) no incluye el envío del cuerpo.
+@app.after_request
+def medir_peticion(response):
+    inicio = g.get('_inicio_peticion')
+    if inicio is not None:
+        endpoint = request.endpoint or 'sin_ruta'
+        metricas.observar('inventario_peticion_segundos', time.perf_counter() - inicio, endpoint=endpoint)
+        metricas.contar('inventario_peticiones_total', endpoint=endpoint, codigo=response.status_code)
+    return response
+
+# --- Validadores HTTP y Compresión ---
+
+# Las respuestas de /search y /detalle llevan un ETag de la generación de la DB:
+# el navegador o un proxy pueden guardarlas y revalidarlas, y mientras no haya
+# un build nuevo la respuesta es un 304 sin cuerpo.
+CACHE_CONTROL_API = "public, no-cache"
+CACHE_CONTROL_PAGINA = "public, max-age=300"
+
+# Solo se comprimen respuestas de texto a partir de este tamaño
+COMPRESION_MIN_BYTES = 1024
+TIPOS_COMPRIMIBLES = {'application/json', 'text/html', 'text/css', 'text/javascript', 'application/javascript'}
+
+def comprimir(response):
+    """Comprime el cuerpo con brotli o gzip según Accept-Encoding."""
+    if response.mimetype not in TIPOS_COMPRIMIBLES:
+        return
+    response.vary.add('Accept-Encoding')
+    if (response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers
+            or response.status_code < 200 or response.status_code in (204, 304)):
+        return
+    cuerpo = response.get_data()
+    if len(cuerpo) < COMPRESION_MIN_BYTES:
+        return
+    aceptadas = request.accept_encodings
+    if brotli is not None and aceptadas['br']:
+        response.set_data(brotli.compress(cuerpo, quality=5))
+        response.headers['Content-Encoding'] = 'br'
+    elif aceptadas['gzip']:
+        response.set_data(gzip.compress(cuerpo, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+
+@app.after_request
+def validadores_y_compresion(response):
+    generacion = g.get('generacion_respuesta')
+    if generacion is not None and response.status_code == 200:
+        response.set_etag(_db_actual['etag'], weak=True)
+        response.last_modified = _db_actual['firma'][1] / 1e9
+        response.headers['Cache-Control'] = CACHE_CONTROL_API
+        response.make_conditional(request)
+    comprimir(response)
+    return response
+
+# --- Página Principal y Recursos Estáticos ---
+
+# La página es la misma para todos mientras no cambie SUCURSALES_ORDEN, así que
+# se renderiza una sola vez y se guardan los bytes ya comprimidos. El CSS y el JS
+# viven en static/ y se sirven con la huella del contenido en el nombre
+# (app.<hash>.css): pueden cachearse un año porque un cambio produce otra URL.
+CACHE_CONTROL_ASSETS = "public, max-age=31536000, immutable"
+ASSETS = ['css/app.css', 'js/app.js']
+
+_assets = {}       # nombre con huella -> recurso precomprimido
+_assets_url = {}   # nombre en static/ -> URL con huella
+_pagina = {'clave': None, 'recurso': None}
+
+def variantes_comprimidas(cuerpo):
+    """Cuerpo sin comprimir más sus variantes gzip/br (si vale la pena comprimirlo)."""
+    variantes = {'identity': cuerpo}
+    if len(cuerpo) >= COMPRESION_MIN_BYTES:
+        variantes['gzip'] = gzip.compress(cuerpo, compresslevel=9, mtime=0)
+        if brotli is not None:
+            variantes['br'] = brotli.compress(cuerpo, quality=11)
+    return variantes
+
+def recurso_estatico(cuerpo, mimetype):
+    return {
+        'variantes': variantes_comprimidas(cuerpo),
+        'mimetype': mimetype,
+        'etag': hashlib.sha1(cuerpo).hexdigest(),
+    }
+
+def responder_recurso(recurso, cache_control):
+    """Respuesta con la variante precomprimida que acepte el cliente."""
+    variantes = recurso['variantes']
+    aceptadas = request.accept_encodings
+    codificacion = 'identity'
+    if 'br' in variantes and aceptadas['br']:
+        codificacion = 'br'
+    elif 'gzip' in variantes and aceptadas['gzip']:
+        codificacion = 'gzip'
+    response = app.response_class(variantes[codificacion], mimetype=recurso['mimetype'])
+    if codificacion != 'identity':
+        response.headers['Content-Encoding'] = codificacion
+    response.vary.add('Accept-Encoding')
+    response.set_etag(recurso['etag'])
+    response.headers['Cache-Control'] = cache_control
+    return response.make_conditional(request)
+
+def cargar_assets():
+    """Lee los recursos de static/ y calcula su huella una sola vez al arrancar."""
+    for nombre in ASSETS:
+        with open(os.path.join(app.static_folder, nombre), 'rb') as f:
+            cuerpo = f.read()
+        base, ext = os.path.splitext(nombre)
+        con_huella = f"{base}.{hashlib.sha256(cuerpo).hexdigest()[:12]}{ext}"
+        mimetype = 'text/css' if ext == '.css' else 'text/javascript'
+        _assets[con_huella] = recurso_estatico(cuerpo, mimetype)
+        _assets_url[nombre] = f"/assets/{con_huella}"
+
+@app.template_global()
+def asset_url(nombre):
+    return _assets_url[nombre]
+
+def pagina_principal():
+    """Página renderizada y precomprimida; solo se vuelve a renderizar si cambian las sucursales."""
+    clave = tuple(SUCURSALES_ORDEN)
+    if _pagina['clave'] != clave:
+        html = render_template('index.html', SUCURSALES_ORDEN=SUCURSALES_ORDEN)
+        _pagina['recurso'] = recurso_estatico(html.encode('utf-8'), 'text/html')
+        _pagina['clave'] = clave
+    return _pagina['recurso']
+
+cargar_assets()
 
 # --- Rutas de la Aplicación ---
 
@@ -451,26 +487,327 @@ def index():
     if not os.path.exists(DATABASE):
         return "Error: La base de datos 'inventario.db' no se ha construido. Ejecuta 'build_index.py' primero.", 500
     
-    return render_template_string(HTML_TEMPLATE, SUCURSALES_ORDEN=SUCURSALES_ORDEN)
+    return responder_recurso(pagina_principal(), CACHE_CONTROL_PAGINA)
+
+@app.route('/assets/<path:nombre>')
+def assets(nombre):
+    recurso = _assets.get(nombre)
+    if recurso is None:
+        abort(404)
+    return responder_recurso(recurso, CACHE_CONTROL_ASSETS)
+
+# --- Compilador de consultas FTS ---
+
+# Pesos de bm25 por columna del FTS, en el orden de la tabla (Codigo, Descripcion,
+# DescProd2): un acierto en el código pesa más que en el código AQ, y este más
+# que en la descripción.
+PESOS_BM25 = (10.0, 1.0, 5.0)
+
+# Cada resultado trae la existencia entera por sucursal desde la tabla pivote
+# 'existencias' (búsqueda por clave primaria Codigo), y los filtros de sucursal
+# y existencia se aplican en la misma consulta: {filtro} es la condición que
+# arma filtro_existencias().
+COLUMNAS_EXISTENCIA = ', '.join(f"e.Existencia_{suc}" for suc in SUCURSALES_BUSQUEDA)
+
+# Los resultados se ordenan por (puntaje, id) y se paginan por clave: {desde}
+# es DESDE_CURSOR cuando se pide la página que sigue a un cursor, así cada
+# página cuesta lo mismo sin importar cuántas se hayan leído antes.
+SQL_BUSQUEDA_FTS = (
+    f"SELECT inventario.DescProd2, inventario.Codigo, inventario.Descripcion, {COLUMNAS_EXISTENCIA}, "
+    f"bm25(inventario, {', '.join(map(str, PESOS_BM25))}) AS puntaje, inventario.rowid AS id "
+    "FROM inventario JOIN existencias e ON e.Codigo = inventario.Codigo WHERE inventario MATCH ?{filtro}{desde} "
+    "ORDER BY puntaje, id LIMIT ?"
+)
+DESDE_CURSOR = " AND (puntaje > ? OR (puntaje = ? AND id > ?))"
+
+# Conteo acotado de coincidencias para la primera página: deja de contar en
+# MAX_CONTEO_RESULTADOS, así una búsqueda amplia no recorre todo el índice.
+MAX_CONTEO_RESULTADOS = 1000
+SQL_CONTEO_FTS = (
+    "SELECT COUNT(*) FROM (SELECT 1 FROM inventario JOIN existencias e ON e.Codigo = inventario.Codigo "
+    "WHERE inventario MATCH ?{filtro} LIMIT ?)"
+)
+
+def filtro_existencias(solo_existencia, sucursales_filtro):
+    """
+    Condición SQL sobre 'existencias' (alias e) que deja los mismos productos
+    para los que /detalle responde con esos filtros: alguna de las sucursales
+    pedidas (o cualquiera) tiene el código y, con 'solo_existencia', existencia
+    positiva (Global no cuenta).
+    """
+    sucursales = [s for s in SUCURSALES_BUSQUEDA if not sucursales_filtro or s in sucursales_filtro]
+    if solo_existencia:
+        condiciones = [f"e.Existencia_{s} > 0" for s in sucursales if s != 'Global']
+    elif sucursales_filtro:
+        condiciones = [f"e.Existencia_{s} IS NOT NULL" for s in sucursales]
+    else:
+        return ""
+    return f" AND ({' OR '.join(condiciones)})" if condiciones else " AND 0"
+
+def producto_busqueda(row):
+    """Resultado de /search: códigos, descripción y existencias de las sucursales donde está el código."""
+    return {
+        "DescProd2": row['DescProd2'],
+        "Codigo": row['Codigo'],
+        "Descripcion": row['Descripcion'],
+        "existencias": {
+            suc: row[f'Existencia_{suc}'] for suc in SUCURSALES_BUSQUEDA if row[f'Existencia_{suc}'] is not None
+        },
+    }
+
+def tokenizar(texto):
+    """
+    Separa el texto en palabras igual que el tokenizer unicode61 del índice:
+    letras y números forman palabras, todo lo demás (espacios, guiones,
+    comillas, operadores FTS) es separador.
+    """
+    tokens, actual = [], []
+    for ch in texto:
+        if unicodedata.category(ch)[0] in 'LN' or unicodedata.category(ch) == 'Co':
+            actual.append(ch)
+        elif actual:
+            tokens.append(''.join(actual))
+            actual = []
+    if actual:
+        tokens.append(''.join(actual))
+    return tokens
+
+def compilar_consulta_fts(texto):
+    """
+    Convierte lo que escribe el usuario en una consulta FTS5 segura: cada palabra
+    es un prefijo entre comillas y todas deben aparecer, en cualquier orden
+    ("martillo 16" -> '"martillo"* "16"*'). Devuelve '' si no hay palabras.
+    """
+    return ' '.join('"' + t.replace('"', '""') + '"*' for t in tokenizar(texto))
+
+# --- Búsqueda por subcadena y aproximada (índice trigram) ---
+
+# Resultados por página de /search (parámetro 'limite', hasta MAX_LIMITE_RESULTADOS)
+LIMITE_RESULTADOS = 50
+MAX_LIMITE_RESULTADOS = 200
+# Candidatos que se traen del índice trigram antes de calcular la distancia de edición
+CANDIDATOS_APROXIMADOS = 200
+# Términos OR que la búsqueda aproximada pasa a MATCH (uno por trigrama)
+MAX_TRIGRAMAS_APROXIMADOS = 32
+# Largo máximo de 'q': códigos y descripciones no pasan de ~100 caracteres
+MAX_LARGO_CONSULTA = 100
+
+SQL_BUSQUEDA_TRIGRAMA = (
+    f"SELECT p.DescProd2, p.Codigo, p.Descripcion, {COLUMNAS_EXISTENCIA}, t.rank AS puntaje, t.rowid AS id "
+    "FROM productos_trigrama t JOIN productos p ON p.id = t.rowid JOIN existencias e ON e.Codigo = p.Codigo "
+    "WHERE productos_trigrama MATCH ?{filtro}{desde} ORDER BY puntaje, id LIMIT ?"
+)
+# La etapa de subcadena deja fuera lo que ya encontró la búsqueda por palabras
+# (ambos índices usan productos.id como rowid), así las dos se pueden mostrar
+# seguidas sin repetir productos: 'UN -43' encuentra 'TRU UNA-435P' por palabras
+# y 'TRU CUN -43P' a media palabra.
+SIN_COINCIDENCIAS_FTS = " AND t.rowid NOT IN (SELECT rowid FROM inventario WHERE inventario MATCH ?)"
+SQL_BUSQUEDA_SUBCADENA = SQL_BUSQUEDA_TRIGRAMA.replace("{filtro}", SIN_COINCIDENCIAS_FTS + "{filtro}")
+SQL_CONTEO_SUBCADENA = (
+    "SELECT COUNT(*) FROM (SELECT 1 FROM productos_trigrama t JOIN productos p ON p.id = t.rowid "
+    f"JOIN existencias e ON e.Codigo = p.Codigo WHERE productos_trigrama MATCH ?{SIN_COINCIDENCIAS_FTS}{{filtro}} LIMIT ?)"
+)
+
+def consulta_trigrama(texto):
+    """Subcadena literal para el índice trigram (mínimo 3 caracteres)."""
+    texto = ' '.join(texto.split())
+    return '"' + texto.replace('"', '""') + '"' if len(texto) >= 3 else ''
+
+def compactar(texto):
+    return ''.join(texto.split()).upper()
+
+def max_errores(texto):
+    """Errores de tecleo tolerados según el largo de lo escrito."""
+    return 1 if len(texto) <= 6 else 2
+
+def distancia_subcadena(patron, texto):
+    """
+    Distancia de edición (Levenshtein) entre 'patron' y el fragmento de 'texto'
+    que mejor se le parece: empezar o terminar a media palabra no cuesta nada,
+    así 'CUN-34P' está a 2 de 'TRUCUN-43P'.
+    """
+    anterior = [0] * (len(texto) + 1)
+    for i, p in enumerate(patron, 1):
+        actual = [i]
+        for j, t in enumerate(texto, 1):
+            actual.append(min(anterior[j] + 1, actual[j - 1] + 1, anterior[j - 1] + (p != t)))
+        anterior = actual
+    return min(anterior)
+
+def buscar_aproximado(cur, texto, filtro="", limite=LIMITE_RESULTADOS):
+    """
+    Búsqueda tolerante a errores de tecleo: trae del índice trigram los productos
+    que comparten más trigramas con el texto y se queda con los que están a una
+    distancia de edición acotada (ver max_errores), ordenados por distancia.
+    """
+    # Los espacios se ignoran en ambos lados: en las etiquetas no siempre se ven
+    patron = compactar(texto)
+    # En orden de aparición, para que el recorte dé siempre los mismos candidatos
+    trigramas = list(dict.fromkeys(patron[i:i + 3] for i in range(len(patron) - 2)))[:MAX_TRIGRAMAS_APROXIMADOS]
+    if not trigramas:
+        return []
+    consulta = ' OR '.join('"' + tri.replace('"', '""') + '"' for tri in trigramas)
+    sql = SQL_BUSQUEDA_TRIGRAMA.format(filtro=filtro, desde="")
+    candidatos = consultar(cur, 'search_aproximado', sql, (consulta, CANDIDATOS_APROXIMADOS))
+    max_dist = max_errores(patron)
+    encontrados = []
+    for row in candidatos:
+        distancia = min(
+            distancia_subcadena(patron, compactar(row['Codigo'] or '')),
+            distancia_subcadena(patron, compactar(row['DescProd2'] or '')),
+        )
+        if distancia <= max_dist:
+            encontrados.append((distancia, len(row['Codigo']), producto_busqueda(row)))
+    encontrados.sort(key=lambda e: e[:2])
+    return [producto for _, _, producto in encontrados[:limite]]
+
+# --- Paginación de /search ---
+
+# Etapas de búsqueda que se pueden paginar, en el orden en que se muestran;
+# la aproximada ya es una sola página.
+ETAPAS_PAGINADAS = {
+    'fts': (SQL_BUSQUEDA_FTS, SQL_CONTEO_FTS),
+    'subcadena': (SQL_BUSQUEDA_SUBCADENA, SQL_CONTEO_SUBCADENA),
+}
+
+def consultas_busqueda(query, query_fts):
+    """Parámetros MATCH de cada etapa paginada (None si la etapa no aplica)."""
+    trigrama = consulta_trigrama(query)
+    return {'fts': (query_fts,), 'subcadena': (trigrama, query_fts) if trigrama else None}
+
+def pagina_busqueda(cur, nombre, sql, consulta, filtro, limite, desde):
+    """
+    Filas de una página de la etapa: las 'limite' siguientes a 'desde'
+    ((puntaje, id) de la última fila de la página anterior, o None para la primera).
+    Trae una fila de más para saber si hay otra página.
+    """
+    params = list(consulta)
+    if desde is not None:
+        params += [desde[0], desde[0], desde[1]]
+    sql = sql.format(filtro=filtro, desde=DESDE_CURSOR if desde is not None else "")
+    return consultar(cur, nombre, sql, params + [limite + 1])
+
+def contar_coincidencias(cur, consultas, filtro):
+    """(total, exacto): coincidencias de todas las etapas hasta MAX_CONTEO_RESULTADOS."""
+    total = 0
+    for etapa, (_, sql) in ETAPAS_PAGINADAS.items():
+        if consultas[etapa] and total <= MAX_CONTEO_RESULTADOS:
+            params = consultas[etapa] + (MAX_CONTEO_RESULTADOS + 1 - total,)
+            total += consultar(cur, 'search_conteo', sql.format(filtro=filtro), params)[0][0]
+    return min(total, MAX_CONTEO_RESULTADOS), total <= MAX_CONTEO_RESULTADOS
+
+def codificar_cursor(generacion, etapa, fila):
+    """Cursor opaco para la página que sigue a 'fila' (None: desde el inicio de la etapa)."""
+    desde = [fila['puntaje'], fila['id']] if fila is not None else [None, None]
+    datos = json.dumps([generacion, etapa] + desde)
+    return base64.urlsafe_b64encode(datos.encode()).decode()
+
+def decodificar_cursor(cursor):
+    """(generacion, etapa, (puntaje, id)). Lanza ValueError si el cursor no es válido."""
+    try:
+        generacion, etapa, puntaje, id_ = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError("Cursor inválido")
+    if etapa not in ETAPAS_PAGINADAS:
+        raise ValueError("Cursor inválido")
+    if puntaje is None and id_ is None:
+        return generacion, etapa, None
+    if not isinstance(puntaje, (int, float)) or not isinstance(id_, int) or isinstance(id_, bool):
+        raise ValueError("Cursor inválido")
+    # Lo que SQLite no puede comparar: enteros fuera de 64 bits, NaN e infinitos
+    # (bm25 y rank siempre son float)
+    try:
+        puntaje = float(puntaje)
+    except OverflowError:
+        raise ValueError("Cursor inválido")
+    if not -2**63 <= id_ < 2**63 or not math.isfinite(puntaje):
+        raise ValueError("Cursor inválido")
+    return generacion, etapa, (puntaje, id_)
+
+def pagina_resultados(cur, consultas, filtro, limite, etapa, desde):
+    """
+    {"productos", "siguiente"}: la página que sigue a 'desde' en 'etapa'. Si la
+    etapa se acaba a media página, se completa con el inicio de la siguiente.
+    """
+    etapas = [e for e in ETAPAS_PAGINADAS if consultas[e]]
+    productos = []
+    for etapa in etapas[etapas.index(etapa):]:
+        faltan = limite - len(productos)
+        filas = pagina_busqueda(cur, f'search_{etapa}', ETAPAS_PAGINADAS[etapa][0], consultas[etapa], filtro, faltan, desde)
+        productos += [producto_busqueda(row) for row in filas[:faltan]]
+        if len(filas) > faltan:
+            fila = filas[faltan - 1] if faltan else None
+            return {"productos": productos, "siguiente": codificar_cursor(g._db_generacion, etapa, fila)}
+        desde = None
+    return {"productos": productos, "siguiente": None}
 
 @app.route('/search')
 def search():
+    """
+    Productos que coinciden con 'q', cada uno con su existencia por sucursal.
+    Acepta los mismos filtros que /detalle (solo_existencia=true, sucursal
+    repetible) y solo devuelve productos para los que /detalle tendría resultados.
+    """
     query = request.args.get('q', '').strip()
-    if not query:
-        return jsonify([])
+    if len(query) > MAX_LARGO_CONSULTA:
+        return jsonify({"error": f"La búsqueda admite hasta {MAX_LARGO_CONSULTA} caracteres"}), 400
+    query_fts = compilar_consulta_fts(query)
+    if not query_fts:
+        return jsonify({"productos": [], "siguiente": None, "total": 0, "total_exacto": True})
+    solo_existencia = request.args.get('solo_existencia') == 'true'
+    sucursales_filtro = sorted(set(request.args.getlist('sucursal')))
+    try:
+        validar_sucursales(sucursales_filtro)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    filtro = filtro_existencias(solo_existencia, sucursales_filtro)
 
-    query_fts = f'"{query}"*' 
-    
+    try:
+        limite = int(request.args.get('limite', LIMITE_RESULTADOS))
+    except ValueError:
+        return jsonify({"error": "'limite' debe ser un número entero"}), 400
+    limite = max(1, min(limite, MAX_LIMITE_RESULTADOS))
+    cursor = request.args.get('cursor', '')
+    try:
+        pagina = decodificar_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Todas las etapas de búsqueda ignoran mayúsculas y espacios repetidos
+    clave = ('search', ' '.join(query.split()).lower(), solo_existencia, tuple(sucursales_filtro), limite, cursor)
+    return respuesta_cacheada(clave, lambda: _search(query, query_fts, filtro, limite, pagina))
+
+def _search(query, query_fts, filtro, limite, pagina):
+    """
+    Una página de resultados: {"productos", "siguiente"} y, en la primera página,
+    "total" (acotado a MAX_CONTEO_RESULTADOS) y "total_exacto".
+    """
     try:
         conn = get_db()
         cur = conn.cursor()
-        
-        cur.execute(
-            "SELECT DescProd2, Codigo, Descripcion FROM inventario WHERE inventario MATCH ? ORDER BY rank LIMIT 50",
-            (query_fts,)
-        )
-        productos = [dict(row) for row in cur.fetchall()]
-        return jsonify(productos)
+        consultas = consultas_busqueda(query, query_fts)
+
+        if pagina is not None:
+            generacion, etapa, desde = pagina
+            if generacion != g._db_generacion:
+                return jsonify({"error": "El índice se actualizó; repite la búsqueda"}), 400
+            if not consultas[etapa]:
+                return jsonify({"error": "Cursor inválido"}), 400
+            return jsonify_medido('search', pagina_resultados(cur, consultas, filtro, limite, etapa, desde))
+
+        # Primero las coincidencias por palabras, seguidas de las de subcadena literal
+        data = pagina_resultados(cur, consultas, filtro, limite, 'fts', None)
+        # Sin ninguna de las dos: búsqueda aproximada
+        if not data["productos"]:
+            productos = buscar_aproximado(cur, query, filtro, limite)
+            data = {"productos": productos, "siguiente": None, "total": len(productos), "total_exacto": True}
+            return jsonify_medido('search', data)
+
+        if data["siguiente"] is None:
+            data["total"], data["total_exacto"] = len(data["productos"]), True
+        else:
+            data["total"], data["total_exacto"] = contar_coincidencias(cur, consultas, filtro)
+        return jsonify_medido('search', data)
         
     except sqlite3.Error as e:
         print(f"Error de búsqueda SQLite: {e}")
@@ -484,56 +821,459 @@ def detalle():
 
     solo_existencia = request.args.get('solo_existencia') == 'true'
     sucursales_filtro = request.args.getlist('sucursal')
+    try:
+        validar_sucursales(sucursales_filtro)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    clave = ('detalle', codigo, solo_existencia, tuple(sorted(set(sucursales_filtro))))
+    return respuesta_cacheada(clave, lambda: _detalle(codigo, solo_existencia, sucursales_filtro))
+
+SQL_DETALLE = "SELECT * FROM existencias WHERE Codigo = ?"
+
+ERROR_NO_ENCONTRADO = "Código de producto no encontrado"
+ERROR_SIN_EXISTENCIAS = "No se encontraron existencias con los filtros aplicados"
+
+def armar_detalle(codigo, producto, solo_existencia, sucursales_filtro):
+    """
+    Detalle de un código a partir de su fila de 'existencias'. Devuelve None si
+    los filtros no dejan ninguna sucursal.
+    """
+    data = {
+        "codigo_buscado": codigo,
+        "sucursales": {},
+        "global": {
+            "Existencia": str(producto['Existencia_Global']),
+            "Clasificacion": producto['Clasificacion_Global'],
+            "DescProd2": producto['DescProd2'],
+            "Descripcion": producto['Descripcion'],
+        }
+    }
 
+    # Mismos filtros que antes se aplicaban en SQL sobre inventario_plain:
+    # 'solo_existencia' excluye Global y las sucursales sin existencia positiva.
+    hay_resultados = False
+    for suc in SUCURSALES_BUSQUEDA:
+        existencia = producto[f'Existencia_{suc}']
+        if existencia is None:
+            continue  # El código no aparece en esa sucursal
+        if solo_existencia and (suc == 'Global' or existencia <= 0):
+            continue
+        if sucursales_filtro and suc not in sucursales_filtro:
+            continue
+        hay_resultados = True
+        if suc != 'Global':
+            data['sucursales'][suc] = {
+                "Sucursal": suc,
+                "Existencia": str(existencia),
+                "Clasificacion": producto[f'Clasificacion_{suc}'],
+                "DescProd2": producto['DescProd2'],
+                "Descripcion": producto['Descripcion'],
+            }
+
+    return data if hay_resultados else None
+
+def _detalle(codigo, solo_existencia, sucursales_filtro):
     try:
         conn = get_db()
-        cur = conn.cursor()
-        
-        # CAMBIO: Volver a agregar 'Clasificacion'
-        query_sql = "SELECT Sucursal, Existencia, Clasificacion, DescProd2, Descripcion FROM inventario_plain WHERE Codigo = ?"
-        params = [codigo]
-        
-        if solo_existencia:
-            query_sql += " AND Sucursal != 'Global' AND CAST(Existencia AS INTEGER) > 0"
-        
-        if sucursales_filtro:
-            placeholders = ', '.join('?' for _ in sucursales_filtro)
-            query_sql += f" AND Sucursal IN ({placeholders})"
-            params.extend(sucursales_filtro)
+        # Una sola búsqueda por clave primaria en la tabla pivote 'existencias'
+        filas = consultar(conn, 'detalle', SQL_DETALLE, (codigo,))
+        if not filas:
+            return jsonify({"error": ERROR_NO_ENCONTRADO}), 404
 
-        cur.execute(query_sql, params)
-        resultados = cur.fetchall()
-        
-        if not resultados:
-            cur.execute("SELECT 1 FROM inventario_plain WHERE Codigo = ? LIMIT 1", (codigo,))
-            if not cur.fetchone():
-                return jsonify({"error": "Código de producto no encontrado"}), 404
-            else:
-                return jsonify({"error": "No se encontraron existencias con los filtros aplicados"}), 404
-
-        data = {
-            "codigo_buscado": codigo,
-            "sucursales": {},
-            "global": {}
-        }
-        
-        # CAMBIO: Volver a agregar 'Clasificacion'
-        cur.execute("SELECT Existencia, Clasificacion, DescProd2, Descripcion FROM inventario_plain WHERE Codigo = ? AND Sucursal = 'Global'", (codigo,))
-        global_data = cur.fetchone()
-        
-        if global_data:
-            data['global'] = dict(global_data)
+        data = armar_detalle(codigo, filas[0], solo_existencia, sucursales_filtro)
+        if data is None:
+            return jsonify({"error": ERROR_SIN_EXISTENCIAS}), 404
 
-        for row in resultados:
-            if row['Sucursal'] != 'Global':
-                data['sucursales'][row['Sucursal']] = dict(row)
+        return jsonify_medido('detalle', data)
+
+    except sqlite3.Error as e:
+        print(f"Error de detalle SQLite: {e}")
+        return jsonify({"error": "Error en la base de datos"}), 500
 
-        return jsonify(data)
+# --- Detalle por lote ---
 
+# Listas de surtido y sesiones de escáner piden muchos códigos a la vez. Se
+# resuelven por tramos de LOTE_DETALLE códigos con una sola consulta cada uno
+# (json_each + clave primaria) y la respuesta se va emitiendo tramo por tramo,
+# así la memoria no crece con el tamaño de la lista.
+LOTE_DETALLE = 500
+MAX_CODIGOS_LOTE = 20000
+
+SQL_DETALLE_LOTE = (
+    "SELECT e.* FROM json_each(?) j JOIN existencias e ON e.Codigo = j.value"
+)
+
+def detalles_por_lote(codigos, solo_existencia, sucursales_filtro):
+    """Genera (codigo, detalle o {"error": ...}) en el orden de 'codigos'."""
+    conn = get_db()
+    for inicio in range(0, len(codigos), LOTE_DETALLE):
+        tramo = codigos[inicio:inicio + LOTE_DETALLE]
+        filas = {row['Codigo']: row for row in consultar(conn, 'detalle_lote', SQL_DETALLE_LOTE, (json.dumps(tramo),))}
+        for codigo in tramo:
+            producto = filas.get(codigo)
+            if producto is None:
+                yield codigo, {"error": ERROR_NO_ENCONTRADO}
+                continue
+            data = armar_detalle(codigo, producto, solo_existencia, sucursales_filtro)
+            yield codigo, data if data is not None else {"error": ERROR_SIN_EXISTENCIAS}
+
+@app.route('/detalle/lote', methods=['POST'])
+def detalle_lote():
+    """
+    Detalle de varios códigos. Cuerpo JSON:
+        {"codigos": [...], "solo_existencia": true, "sucursal": ["HI", ...]}
+    Responde un objeto {codigo: detalle} con la misma forma que /detalle; los
+    códigos sin resultado llevan {"error": ...} con el mensaje del 404 de /detalle.
+    """
+    datos = request.get_json(silent=True)
+    if not isinstance(datos, dict) or not isinstance(datos.get('codigos'), list):
+        return jsonify({"error": "Se esperaba un JSON con la lista 'codigos'"}), 400
+
+    # Todo se valida antes de empezar a emitir: después ya se mandó el 200
+    if any(isinstance(c, bool) or not isinstance(c, (str, int)) for c in datos['codigos']):
+        return jsonify({"error": "Cada código debe ser texto o número"}), 400
+    # Sin repetidos y en el orden en que llegaron
+    codigos = list(dict.fromkeys(str(c).strip() for c in datos['codigos'] if str(c).strip()))
+    if not codigos:
+        return jsonify({"error": "No se proporcionó código de producto"}), 400
+    if len(codigos) > MAX_CODIGOS_LOTE:
+        return jsonify({"error": f"Máximo {MAX_CODIGOS_LOTE} códigos por petición"}), 400
+
+    solo_existencia = datos.get('solo_existencia') is True
+    sucursales_filtro = datos.get('sucursal') or []
+    if isinstance(sucursales_filtro, str):
+        sucursales_filtro = [sucursales_filtro]
+    if not isinstance(sucursales_filtro, list) or not all(isinstance(s, str) for s in sucursales_filtro):
+        return jsonify({"error": "'sucursal' debe ser una lista de sucursales"}), 400
+    try:
+        validar_sucursales(sucursales_filtro)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        get_db()  # Falla aquí, antes de empezar a emitir, si no hay DB
     except sqlite3.Error as e:
         print(f"Error de detalle SQLite: {e}")
         return jsonify({"error": "Error en la base de datos"}), 500
 
+    def generar():
+        separador = '{'
+        for codigo, data in detalles_por_lote(codigos, solo_existencia, sucursales_filtro):
+            yield f"{separador}{app.json.dumps(codigo)}: {app.json.dumps(data)}"
+            separador = ', '
+        yield '{}' if separador == '{' else '}'
+
+    return app.response_class(stream_with_context(generar()), mimetype='application/json')
+
+# --- Exportación ---
+
+# /exportar entrega filas de inventario_plain filtradas en SQL, en CSV o NDJSON.
+# Las filas se leen del cursor de a FILAS_POR_TRAMO y se emiten conforme salen,
+# así la memoria es la misma para 10 filas que para todo el catálogo.
+FILAS_POR_TRAMO = 1000
+COLUMNAS_EXPORTACION = ["Codigo", "Descripcion", "DescProd2", "Sucursal", "Existencia", "Clasificacion"]
+FORMATOS_EXPORTACION = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+def filtros_exportacion(args):
+    """Convierte los parámetros de /exportar en (WHERE, parámetros). Lanza ValueError si no son válidos."""
+    condiciones, params = [], []
+
+    sucursales = args.getlist('sucursal')
+    validar_sucursales(sucursales)
+    if sucursales:
+        condiciones.append(f"Sucursal IN ({', '.join('?' * len(sucursales))})")
+        params.extend(sucursales)
+
+    clasificaciones = args.getlist('clasificacion')
+    if clasificaciones:
+        condiciones.append(f"Clasificacion IN ({', '.join('?' * len(clasificaciones))})")
+        params.extend(clasificaciones)
+
+    for parametro, operador in (('existencia_min', '>='), ('existencia_max', '<=')):
+        valor = args.get(parametro, '').strip()
+        if not valor:
+            continue
+        try:
+            numero = float(valor)
+        except ValueError:
+            raise ValueError(f"'{parametro}' debe ser un número")
+        if not math.isfinite(numero):
+            raise ValueError(f"'{parametro}' debe ser un número")
+        # Se filtra sobre la existencia tal como se exporta y se muestra, no sobre la suma sin redondear
+        condiciones.append(f"CAST(Existencia AS INTEGER) {operador} ?")
+        params.append(numero)
+
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    return where, params
+
+def lineas_csv(cur):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNAS_EXPORTACION)
+    while True:
+        filas = cur.fetchmany(FILAS_POR_TRAMO)
+        if not filas:
+            break
+        writer.writerows(filas)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()  # Solo el encabezado: la consulta no devolvió filas
+
+def lineas_ndjson(cur):
+    while True:
+        filas = cur.fetchmany(FILAS_POR_TRAMO)
+        if not filas:
+            break
+        yield ''.join(json.dumps(dict(zip(COLUMNAS_EXPORTACION, fila)), ensure_ascii=False) + '\n' for fila in filas)
+
+def comprimir_stream(trozos):
+    """Comprime con gzip un generador de texto sin juntarlo en memoria."""
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: formato gzip
+    for trozo in trozos:
+        comprimido = compresor.compress(trozo.encode('utf-8'))
+        if comprimido:
+            yield comprimido
+    yield compresor.flush()
+
+@app.route('/exportar')
+def exportar():
+    """
+    Exporta existencias filtradas. Parámetros (todos opcionales):
+    sucursal y clasificacion (repetibles), existencia_min / existencia_max
+    (inclusivos) y formato=csv|ndjson. Se comprime con gzip si el cliente lo acepta.
+    Ej.: /exportar?sucursal=EX&existencia_max=-1
+    """
+    formato = request.args.get('formato', 'csv').lower()
+    if formato not in FORMATOS_EXPORTACION:
+        return jsonify({"error": f"Formato no soportado: {formato}"}), 400
+    try:
+        where, params = filtros_exportacion(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        cur = get_db().cursor()
+        cur.row_factory = None  # Tuplas: no hace falta sqlite3.Row para escribir filas
+        cur.execute(
+            f"SELECT {', '.join(COLUMNAS_EXPORTACION)} FROM inventario_plain {where} ORDER BY Codigo, Sucursal",
+            params
+        )
+    except sqlite3.Error as e:
+        print(f"Error de exportación SQLite: {e}")
+        return jsonify({"error": "Error en la base de datos"}), 500
+
+    trozos = lineas_csv(cur) if formato == 'csv' else lineas_ndjson(cur)
+    headers = {'Content-Disposition': f'attachment; filename="inventario.{formato}"'}
+    if request.accept_encodings['gzip']:
+        trozos = comprimir_stream(trozos)
+        headers['Content-Encoding'] = 'gzip'
+    response = app.response_class(stream_with_context(trozos), mimetype=FORMATOS_EXPORTACION[formato], headers=headers)
+    response.vary.add('Accept-Encoding')
+    return response
+
+# --- Resumen ---
+
+# Totales por sucursal y clasificación precalculados en la tabla 'resumen'
+# (build_index.py): la consulta recorre unas decenas de grupos, no el inventario.
+COLUMNAS_RESUMEN = ["Productos", "Existencia", "Negativos", "EnCero", "ConExistencia"]
+SQL_RESUMEN = f"SELECT Sucursal, Clasificacion, {', '.join(COLUMNAS_RESUMEN)} FROM resumen"
+
+@app.route('/resumen')
+def resumen():
+    """
+    Totales de inventario por sucursal y, dentro de cada una, por clasificación:
+    productos, suma de existencias y cuántos están en negativo, en cero o con
+    existencia. Filtros opcionales y repetibles: sucursal, clasificacion.
+    Ej.: /resumen?clasificacion=A (artículos A en cero por sucursal)
+    """
+    sucursales = request.args.getlist('sucursal')
+    try:
+        validar_sucursales(sucursales)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    clasificaciones = request.args.getlist('clasificacion')
+
+    clave = ('resumen', tuple(sorted(set(sucursales))), tuple(sorted(set(clasificaciones))))
+    return respuesta_cacheada(clave, lambda: _resumen(sucursales, clasificaciones))
+
+def _resumen(sucursales, clasificaciones):
+    condiciones, params = [], []
+    if sucursales:
+        condiciones.append(f"Sucursal IN ({', '.join('?' * len(sucursales))})")
+        params.extend(sucursales)
+    if clasificaciones:
+        condiciones.append(f"Clasificacion IN ({', '.join('?' * len(clasificaciones))})")
+        params.extend(clasificaciones)
+    where = f" WHERE {' AND '.join(condiciones)}" if condiciones else ""
+
+    try:
+        filas = consultar(get_db(), 'resumen', SQL_RESUMEN + where + " ORDER BY Clasificacion", params)
+    except sqlite3.Error as e:
+        print(f"Error de resumen SQLite: {e}")
+        return jsonify({"error": "Error en la base de datos"}), 500
+
+    data = {}
+    for suc in SUCURSALES_BUSQUEDA:
+        grupos = [fila for fila in filas if fila['Sucursal'] == suc]
+        if not grupos:
+            continue
+        totales = {col: sum(fila[col] for fila in grupos) for col in COLUMNAS_RESUMEN}
+        totales["clasificaciones"] = {
+            fila['Clasificacion']: {col: fila[col] for col in COLUMNAS_RESUMEN} for fila in grupos
+        }
+        data[suc] = totales
+    return jsonify_medido('resumen', data)
+
+# --- Historial ---
+
+# build_index.py guarda en HISTORIAL_DB solo las celdas (Codigo, Sucursal) que
+# cambian en cada build, más un checkpoint completo cada tantos builds. La
+# historia de un producto se lee con un recorrido de rango sobre la clave
+# (Codigo, Snapshot, Sucursal) de 'cambios', empezando en el último checkpoint
+# anterior a 'desde'. Ese archivo se modifica en su lugar, así que no se
+# reutiliza la conexión entre peticiones.
+SQL_HISTORIAL_RANGO = (
+    "SELECT MAX(CASE WHEN Construido <= ? THEN Snapshot END), MIN(Snapshot), "
+    "MAX(CASE WHEN Construido <= ? THEN Snapshot END) FROM snapshots"
+)
+SQL_HISTORIAL_CHECKPOINT = "SELECT MAX(Snapshot) FROM snapshots WHERE Completo AND Snapshot <= ?"
+SQL_HISTORIAL_BUILD = "SELECT Generacion, Construido FROM snapshots WHERE Snapshot = ?"
+SQL_HISTORIAL = (
+    "SELECT c.Snapshot, s.Generacion, s.Construido, c.Sucursal, c.Existencia, c.Clasificacion "
+    "FROM cambios c JOIN snapshots s ON s.Snapshot = c.Snapshot "
+    "WHERE c.Codigo = ? AND c.Snapshot BETWEEN ? AND ? ORDER BY c.Snapshot"
+)
+
+def fecha_historial(valor, fin_del_dia=False):
+    """Fecha u hora ISO de 'desde'/'hasta' en el formato de Construido. Lanza ValueError si no es válida."""
+    fecha = datetime.datetime.fromisoformat(valor)
+    if fin_del_dia and len(valor) == 10:
+        fecha = fecha.replace(hour=23, minute=59, second=59)  # 'hasta' con solo la fecha incluye ese día
+    return fecha.isoformat(timespec='seconds')
+
+@app.route('/historial')
+def historial():
+    """
+    Existencia y clasificación de un código a lo largo de los builds. Parámetros:
+    codigo, sucursal (repetible, opcional) y desde / hasta (fecha u hora ISO,
+    opcionales). Cada sucursal trae el valor vigente en 'desde' y después un
+    punto por cada build en que cambió; Existencia null = ya no aparece ahí.
+    """
+    codigo = request.args.get('codigo', '').strip()
+    if not codigo:
+        return jsonify({"error": "No se proporcionó código de producto"}), 400
+    sucursales_filtro = request.args.getlist('sucursal')
+    try:
+        desde = fecha_historial(request.args['desde']) if request.args.get('desde') else ''
+        hasta = fecha_historial(request.args['hasta'], fin_del_dia=True) if request.args.get('hasta') else '9999'
+    except ValueError:
+        return jsonify({"error": "'desde' y 'hasta' deben ser fechas ISO (AAAA-MM-DD o AAAA-MM-DDTHH:MM:SS)"}), 400
+
+    if not os.path.exists(HISTORIAL_DB):
+        return jsonify({"error": "Todavía no hay historial de existencias"}), 404
+    conn = sqlite3.connect(f"file:{HISTORIAL_DB}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        inicio, primero, fin = consultar(conn, 'historial_rango', SQL_HISTORIAL_RANGO, (desde, hasta))[0]
+        inicio = inicio or primero  # 'desde' anterior al primer build registrado
+        if inicio is None or fin is None or fin < inicio:
+            return jsonify({"error": "No hay builds registrados en ese periodo"}), 404
+        checkpoint = consultar(conn, 'historial_checkpoint', SQL_HISTORIAL_CHECKPOINT, (inicio,))[0][0]
+        filas = consultar(conn, 'historial', SQL_HISTORIAL, (codigo, checkpoint, fin))
+        build_inicio = consultar(conn, 'historial_build', SQL_HISTORIAL_BUILD, (inicio,))[0]
+    except sqlite3.Error as e:
+        print(f"Error de historial SQLite: {e}")
+        return jsonify({"error": "Error en la base de datos"}), 500
+    finally:
+        conn.close()
+
+    # Del checkpoint a 'inicio' solo importa el valor vigente de cada sucursal,
+    # que se emite con la fecha de 'inicio'. Después, un punto por cada cambio
+    # real: los checkpoints repiten todas las celdas aunque no hayan cambiado.
+    vigente = {}
+    for fila in filas:
+        if fila['Snapshot'] > inicio:
+            break
+        vigente[fila['Sucursal']] = (fila['Existencia'], fila['Clasificacion'])
+    series, ultimo = {}, {}
+
+    def agregar(suc, build, valor):
+        series.setdefault(suc, []).append({
+            "Generacion": build['Generacion'],
+            "Construido": build['Construido'],
+            "Existencia": valor[0],
+            "Clasificacion": valor[1],
+        })
+        ultimo[suc] = valor
+
+    for suc, valor in vigente.items():
+        if valor[0] is not None:
+            agregar(suc, build_inicio, valor)
+    for fila in filas:
+        valor = (fila['Existencia'], fila['Clasificacion'])
+        if fila['Snapshot'] > inicio and valor != ultimo.get(fila['Sucursal'], (None, None)):
+            agregar(fila['Sucursal'], fila, valor)
+
+    if sucursales_filtro:
+        series = {suc: serie for suc, serie in series.items() if suc in sucursales_filtro}
+    if not series:
+        return jsonify({"error": ERROR_NO_ENCONTRADO}), 404
+    return jsonify_medido('historial', {
+        "codigo_buscado": codigo,
+        "desde": build_inicio['Construido'],
+        "sucursales": series,
+    })
+
+@app.route('/metrics')
+def metrics():
+    """Métricas de este worker en formato de texto de Prometheus."""
+    return app.response_class(metricas.exposicion(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/cache/stats')
+def cache_stats():
+    """Contadores de la caché de resultados de este worker."""
+    return jsonify(cache_resultados.stats())
+
+# --- Calentamiento del Worker ---
+
+# Bloque de lectura para traer el archivo de la DB a la caché del sistema operativo
+BLOQUE_CALENTAMIENTO = 1024 * 1024
+
+def calentar(conexiones=1):
+    """
+    Deja listo el worker antes de recibir tráfico (gunicorn.conf.py lo llama al
+    arrancar cada worker con conexiones = hilos del worker): lee el archivo de la
+    DB completo para tener sus páginas en memoria, abre 'conexiones' conexiones
+    con las sentencias de /search y /detalle ya preparadas, y renderiza la
+    página principal.
+    """
+    with app.test_request_context('/'):
+        pagina_principal()
+    if not os.path.exists(DATABASE):
+        print(f"AVISO: No se encuentra '{DATABASE}'; el worker arranca sin calentar.")
+        return
+    with open(DATABASE, 'rb') as f:
+        while f.read(BLOQUE_CALENTAMIENTO):
+            pass
+    # Se toman todas a la vez para que sean conexiones distintas
+    abiertas = []
+    try:
+        generacion_actual()
+        for _ in range(conexiones):
+            firma, db = tomar_conexion()
+            abiertas.append((firma, db))
+            cur = db.cursor()
+            cur.execute(SQL_BUSQUEDA_FTS.format(filtro="", desde=""), ('"a"*', 1)).fetchall()
+            cur.execute(SQL_BUSQUEDA_TRIGRAMA.format(filtro="", desde=""), ('"aaa"', 1)).fetchall()
+            cur.execute(SQL_DETALLE, ('',)).fetchall()
+    except sqlite3.Error as e:
+        print(f"AVISO: No se pudo calentar la DB: {e}")
+    finally:
+        for conexion in abiertas:
+            _conexiones.put(conexion)
+
 if __name__ == "__main__":
     if not os.path.exists(DATABASE):
         print(f"Error: No se encuentra la base de datos '{DATABASE}'.")
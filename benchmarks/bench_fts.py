@@ -0,0 +1,96 @@
+"""
+Compara distintas configuraciones de la tabla FTS5 de /search: tamaño en disco
+del índice y latencia de la consulta MATCH de búsqueda, usando los productos
+(filas Global) de una inventario.db ya construida.
+
+Uso (desde la raíz del repo, después de correr build_index.py):
+    python benchmarks/bench_fts.py [--db inventario.db] [--consultas 2000]
+"""
+import argparse
+import os
+import random
+import re
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import PESOS_BM25  # noqa: E402
+from build_index import FTS_OPCIONES  # noqa: E402
+
+# (nombre, opciones fts5, ¿external content?, pesos bm25 o None para el rank por defecto)
+VARIANTES = [
+    ("contentless (anterior)", "content=''", False, None),
+    ("external, detail=full", "content='productos', content_rowid='id'", True, None),
+    ("external, full, prefix='2 3'", "content='productos', content_rowid='id', prefix='2 3'", True, None),
+    ("external, column, prefix='2 3'", "content='productos', content_rowid='id', prefix='2 3', detail=column", True, None),
+    # La que usan build_index.py y /search: la base contra la que comparar cualquier ajuste
+    ("producción (build_index + bm25)", FTS_OPCIONES, True, PESOS_BM25),
+]
+
+SQL_BUSQUEDA = "SELECT DescProd2, Codigo, Descripcion FROM inventario WHERE inventario MATCH ? ORDER BY {orden} LIMIT 50"
+# Con el índice sin contenido, los valores hay que buscarlos aparte por cada resultado
+SQL_BUSQUEDA_CONTENTLESS = "SELECT rowid FROM inventario WHERE inventario MATCH ? ORDER BY rank LIMIT 50"
+SQL_LOOKUP = "SELECT DescProd2, Codigo, Descripcion FROM productos WHERE id = ?"
+
+
+def construir(path, productos, opciones, optimize=True):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE productos (id INTEGER PRIMARY KEY, Codigo TEXT NOT NULL UNIQUE, Descripcion TEXT, DescProd2 TEXT)")
+    conn.executemany("INSERT INTO productos (Codigo, Descripcion, DescProd2) VALUES (?, ?, ?)", productos)
+    conn.execute(f"CREATE VIRTUAL TABLE inventario USING fts5(Codigo, Descripcion, DescProd2, {opciones})")
+    conn.execute("INSERT INTO inventario (rowid, Codigo, Descripcion, DescProd2) SELECT id, Codigo, Descripcion, DescProd2 FROM productos")
+    if optimize:
+        conn.execute("INSERT INTO inventario (inventario) VALUES ('optimize')")
+    conn.commit()
+    tamano = conn.execute("SELECT SUM(pgsize) FROM dbstat WHERE name IN ('inventario_data', 'inventario_idx', 'inventario_docsize', 'inventario_config')").fetchone()[0]
+    return conn, tamano
+
+def consultas_de_prueba(productos, n, seed=0):
+    """Prefijos de 2 a 6 letras de palabras reales, como los escribe el personal."""
+    rng = random.Random(seed)
+    palabras = [p for _, desc, _ in productos for p in re.findall(r"\w{3,}", desc)]
+    return [f'"{p[:rng.randint(2, 6)]}"*' for p in rng.sample(palabras, min(n, len(palabras)))]
+
+def medir(conn, consultas, contentless, pesos=None):
+    orden = f"bm25(inventario, {', '.join(map(str, pesos))})" if pesos else "rank"
+    sql = SQL_BUSQUEDA.format(orden=orden)
+    tiempos = []
+    for q in consultas:
+        t0 = time.perf_counter()
+        if contentless:
+            ids = [r[0] for r in conn.execute(SQL_BUSQUEDA_CONTENTLESS, (q,))]
+            for i in ids:
+                conn.execute(SQL_LOOKUP, (i,)).fetchone()
+        else:
+            conn.execute(sql, (q,)).fetchall()
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    tiempos.sort()
+    return statistics.mean(tiempos), tiempos[int(len(tiempos) * 0.95)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', default='inventario.db')
+    parser.add_argument('--consultas', type=int, default=2000)
+    args = parser.parse_args()
+
+    origen = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    productos = origen.execute(
+        "SELECT Codigo, Descripcion, DescProd2 FROM inventario_plain WHERE Sucursal = 'Global' ORDER BY Codigo"
+    ).fetchall()
+    origen.close()
+    consultas = consultas_de_prueba(productos, args.consultas)
+
+    print(f"{len(productos)} productos, {len(consultas)} consultas")
+    print(f"{'variante':<32} {'índice (KB)':>12} {'media (ms)':>11} {'p95 (ms)':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, (nombre, opciones, externo, pesos) in enumerate(VARIANTES):
+            conn, tamano = construir(os.path.join(tmp, f"v{i}.db"), productos, opciones)
+            media, p95 = medir(conn, consultas, contentless=not externo, pesos=pesos)
+            print(f"{nombre:<32} {tamano / 1024:>12.0f} {media:>11.3f} {p95:>9.3f}")
+            conn.close()
+
+if __name__ == "__main__":
+    main()
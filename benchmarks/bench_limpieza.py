@@ -0,0 +1,110 @@
+"""
+Benchmark de la etapa de limpieza de build_index.py: compara la versión anterior
+(Series.apply fila por fila) con la vectorizada sobre catálogos sintéticos y
+verifica que ambas producen exactamente los mismos valores.
+
+Uso (desde la raíz del repo):
+    python benchmarks/bench_limpieza.py [--filas 100000 1000000 5000000]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import build_index  # noqa: E402
+
+
+# --- Implementación anterior (referencia) ---
+
+def clean_text_fila(value):
+    return str(value).strip() if pd.notna(value) else ""
+
+def clean_existence_fila(value):
+    if pd.isna(value):
+        return 0.0
+    cleaned_text = re.sub(r"[^0-9.-]", "", str(value).strip())
+    if cleaned_text in ['-', '.', '-.']:
+        return 0.0
+    try:
+        return float(cleaned_text)
+    except ValueError:
+        return 0.0
+
+def limpiar_por_fila(df):
+    return pd.DataFrame({
+        'Codigo': df['Codigo'].apply(clean_text_fila),
+        'Descripcion': df['Descripcion'].apply(clean_text_fila),
+        'DescProd2': df['DescProd2'].apply(clean_text_fila),
+        'Clasificacion': df['Clasificacion'].apply(clean_text_fila).replace('', 'S/M'),
+        'Existencia': df['Existencia'].apply(clean_existence_fila),
+    })
+
+def limpiar_vectorizado(df):
+    existencias, _ = build_index.clean_existence(df['Existencia'])
+    return pd.DataFrame({
+        'Codigo': build_index.clean_text(df['Codigo']),
+        'Descripcion': build_index.clean_text(df['Descripcion']),
+        'DescProd2': build_index.clean_text(df['DescProd2']),
+        'Clasificacion': build_index.por_valores_unicos(df['Clasificacion'], build_index.clean_text).replace('', 'S/M'),
+        'Existencia': existencias,
+    })
+
+
+# --- Datos sintéticos ---
+
+def catalogo_sintetico(filas, seed=0):
+    """Columnas como las lee pd.read_csv(dtype=str), con espacios, vacíos y valores sucios."""
+    rng = np.random.default_rng(seed)
+    n_unicos = 50_000
+    codigos = np.array([f" TRU {i:05d}P " if i % 7 == 0 else f"COD-{i}" for i in range(n_unicos)], dtype=object)
+    descs = np.array([f"PRODUCTO {i} {'X' * (i % 13)}" for i in range(n_unicos)], dtype=object)
+    clases = np.array(['A', 'B', 'C', 'Sin Mov', ' ', None], dtype=object)
+
+    inv = rng.normal(10, 40, filas)
+    inv = np.where(rng.random(filas) < 0.6, inv.round(0), inv.round(3)).astype(str).astype(object)
+    sucio = rng.random(filas)
+    inv[sucio < 0.02] = None
+    inv[(sucio >= 0.02) & (sucio < 0.03)] = "1,250.5 pz"
+    inv[(sucio >= 0.03) & (sucio < 0.035)] = "-"
+    inv[(sucio >= 0.035) & (sucio < 0.04)] = "s/n"
+    inv[(sucio >= 0.04) & (sucio < 0.045)] = "1.2.3"
+
+    idx = rng.integers(0, n_unicos, filas)
+    desc2 = rng.integers(0, 30000, filas).astype(str).astype(object)
+    desc2[rng.random(filas) < 0.05] = None
+    return pd.DataFrame({
+        'Codigo': codigos[idx],
+        'Descripcion': descs[idx],
+        'DescProd2': desc2,
+        'Clasificacion': clases[rng.integers(0, len(clases), filas)],
+        'Existencia': inv,
+    }).astype(str)  # mismo dtype que read_csv(dtype=str): los None quedan como NaN
+
+
+def medir(fn, *args):
+    t0 = time.perf_counter()
+    resultado = fn(*args)
+    return resultado, time.perf_counter() - t0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--filas', type=int, nargs='+', default=[100_000, 500_000, 1_000_000, 5_000_000])
+    args = parser.parse_args()
+
+    print(f"{'filas':>10} {'por fila (s)':>13} {'vectorizado (s)':>16} {'speedup':>8}  iguales")
+    for filas in args.filas:
+        df = catalogo_sintetico(filas)
+        antes, t_antes = medir(limpiar_por_fila, df)
+        despues, t_despues = medir(limpiar_vectorizado, df)
+        iguales = antes.equals(despues)
+        print(f"{filas:>10} {t_antes:>13.2f} {t_despues:>16.2f} {t_antes / t_despues:>7.1f}x  {iguales}")
+        if not iguales:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Mide el throughput de la página principal (/) con el cliente de pruebas de Flask
+y lo compara con renderizar la plantilla en cada petición, como se hacía antes
+con render_template_string.
+
+Uso (desde la raíz del repo, con inventario.db construida):
+    python benchmarks/bench_pagina.py [--peticiones 3000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from flask import render_template_string  # noqa: E402
+
+import app as app_module  # noqa: E402
+
+
+def medir(nombre, fn, peticiones):
+    fn()  # calentamiento
+    t0 = time.perf_counter()
+    for _ in range(peticiones):
+        fn()
+    dt = time.perf_counter() - t0
+    print(f"{nombre:<40} {peticiones / dt:>10.0f} req/s {dt / peticiones * 1e6:>10.1f} µs/req")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--peticiones', type=int, default=3000)
+    args = parser.parse_args()
+
+    app = app_module.app
+    cliente = app.test_client()
+    with open(os.path.join(app.root_path, 'templates', 'index.html'), encoding='utf-8') as f:
+        fuente = f.read()
+
+    def render_por_peticion():
+        with app.test_request_context('/'):
+            render_template_string(fuente, SUCURSALES_ORDEN=app_module.SUCURSALES_ORDEN,
+                                   asset_url=app_module.asset_url)
+
+    medir("render_template_string por petición", render_por_peticion, args.peticiones)
+    medir("GET / (página pre-renderizada)", lambda: cliente.get('/'), args.peticiones)
+    medir("GET / con gzip", lambda: cliente.get('/', headers={'Accept-Encoding': 'gzip'}), args.peticiones)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+Suite de rendimiento: construye el índice a partir de un catálogo sintético
+(ver catalogo_sintetico.py) midiendo cada fase del build y la memoria pico, y
+después lanza peticiones concurrentes a /search, /detalle y / para medir
+latencias p50/p95/p99 y throughput. El resultado es un JSON para comparar
+entre commits.
+
+Uso (desde la raíz del repo):
+    python benchmarks/bench_rendimiento.py [--skus 20000] [--sucursales 5]
+        [--modos completo streaming incremental] [--peticiones 3000] [--hilos 8]
+        [--url http://127.0.0.1:8000] [--salida resultados.json] [--comparar base.json]
+
+Sin --url las peticiones pasan por el cliente de pruebas de Flask. Para medir
+gunicorn: construir primero con --directorio DIR --peticiones 0, levantar
+`gunicorn --chdir DIR --pythonpath . app:app` y correr
+--directorio DIR --modos --url http://127.0.0.1:8000.
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import catalogo_sintetico  # noqa: E402
+
+# Funciones de build_index.py que se cronometran como fases del build
+FASES_BUILD = ['leer_sucursales', 'agrupar_por_sucursal', 'formatear_filas',
+               'crear_indices_y_fts', 'recalcular_global', 'publicar_db']
+
+# Proporción de cada endpoint en la carga
+MEZCLA = [('search', 0.6), ('detalle', 0.35), ('pagina', 0.05)]
+
+
+# --- Build (en un proceso hijo, para medir su memoria por separado) ---
+
+def build_hijo(directorio, modo, sucursales, salida):
+    """Corre un build dentro de 'directorio' y escribe sus tiempos y memoria en 'salida'."""
+    os.chdir(directorio)
+    import build_index
+
+    build_index.SUCURSALES_FILES = sucursales
+    # Los builds completos se miden sin caché de lectura (si no, repetir el
+    # benchmark en el mismo --directorio mediría un build sin parseo); el
+    # incremental la usa como en producción.
+    if modo != 'incremental':
+        shutil.rmtree(build_index.CACHE_LECTURA_DIR, ignore_errors=True)
+    fases = {}
+
+    def cronometrar(nombre, fn):
+        def envuelta(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                fases[nombre] = fases.get(nombre, 0.0) + time.perf_counter() - t0
+        return envuelta
+
+    for nombre in FASES_BUILD:
+        setattr(build_index, nombre, cronometrar(nombre, getattr(build_index, nombre)))
+
+    t0 = time.perf_counter()
+    with open('build.log', 'a') as log:
+        stdout, sys.stdout = sys.stdout, log
+        try:
+            if modo == 'incremental':
+                build_index.main_incremental()
+            elif modo == 'streaming':
+                build_index.main_streaming()
+            else:
+                build_index.main()
+        finally:
+            sys.stdout = stdout
+    total = time.perf_counter() - t0
+
+    # ru_maxrss está en KiB en Linux; el de los hijos cubre los procesos de lectura
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+              resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    resultado = {
+        'total_s': round(total, 3),
+        'fases_s': {k: round(v, 3) for k, v in fases.items()},
+        'rss_pico_mb': round(rss / 1024, 1),
+    }
+    # Detalle por sub-fase del reporte que escribe el propio build
+    if os.path.exists(build_index.REPORTE_BUILD_PATH):
+        with open(build_index.REPORTE_BUILD_PATH, encoding='utf-8') as f:
+            resultado['reporte_s'] = {fase['fase']: fase['segundos'] for fase in json.load(f)['fases']}
+    with open(salida, 'w') as f:
+        json.dump(resultado, f)
+
+def medir_build(directorio, modo, sucursales):
+    salida = os.path.join(directorio, f"build_{modo}.json")
+    subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--build-hijo', directorio, modo, ','.join(sucursales), salida],
+        check=True, env={**os.environ, 'PYTHONPATH': RAIZ},
+    )
+    with open(salida) as f:
+        return json.load(f)
+
+def tocar_una_sucursal(directorio, sucursal, skus, seed):
+    """Reescribe las existencias de una sucursal para que el build incremental tenga trabajo."""
+    rng = random.Random(seed + 1)
+    productos = catalogo_sintetico.catalogo(skus, random.Random(seed))
+    catalogo_sintetico.escribir_sucursal(os.path.join(directorio, f"{sucursal}.csv"), productos, rng,
+                                         ancho=sucursal in catalogo_sintetico.SUCURSALES_ANCHAS)
+
+
+# --- Carga de consultas ---
+
+def urls_de_prueba(directorio, n, seed=0):
+    """Mezcla de /search (prefijos de palabras reales), /detalle (códigos, algunos inexistentes) y /."""
+    conn = sqlite3.connect(os.path.join(directorio, 'inventario.db'))
+    productos = conn.execute("SELECT Codigo, Descripcion FROM productos").fetchall()
+    conn.close()
+    rng = random.Random(seed)
+    palabras = [p for _, desc in productos for p in re.findall(r"\w{3,}", desc)]
+    tipos = rng.choices([t for t, _ in MEZCLA], weights=[w for _, w in MEZCLA], k=n)
+    urls = []
+    for tipo in tipos:
+        if tipo == 'search':
+            q = ' '.join(p[:rng.randint(2, len(p))] for p in rng.sample(palabras, rng.randint(1, 2)))
+            urls.append((tipo, '/search?' + urllib.parse.urlencode({'q': q})))
+        elif tipo == 'detalle':
+            codigo = rng.choice(productos)[0] if rng.random() < 0.95 else 'NO-EXISTE-' + str(rng.randint(0, 10**6))
+            params = [('codigo', codigo)]
+            if rng.random() < 0.3:
+                params.append(('solo_existencia', 'true'))
+            urls.append((tipo, '/detalle?' + urllib.parse.urlencode(params)))
+        else:
+            urls.append((tipo, '/'))
+    return urls
+
+def cliente_flask(directorio, sin_cache):
+    """Función url -> código HTTP usando el cliente de pruebas (un cliente por hilo)."""
+    os.chdir(directorio)
+    import app as app_module
+    if sin_cache:
+        app_module.cache_resultados = app_module.CacheLRU(0, 0)
+    locales = threading.local()
+
+    def pedir(url):
+        cliente = getattr(locales, 'cliente', None)
+        if cliente is None:
+            cliente = locales.cliente = app_module.app.test_client()
+        respuesta = cliente.get(url, headers={'Accept-Encoding': 'gzip'})
+        respuesta.get_data()
+        return respuesta.status_code
+    return pedir
+
+def cliente_http(base):
+    def pedir(url):
+        peticion = urllib.request.Request(base.rstrip('/') + url, headers={'Accept-Encoding': 'gzip'})
+        try:
+            with urllib.request.urlopen(peticion) as respuesta:
+                respuesta.read()
+                return respuesta.status
+        except urllib.error.HTTPError as e:
+            return e.code
+    return pedir
+
+def percentiles(tiempos):
+    if len(tiempos) < 2:
+        valor = round(tiempos[0], 3) if tiempos else None
+        return {'p50_ms': valor, 'p95_ms': valor, 'p99_ms': valor}
+    cortes = statistics.quantiles(tiempos, n=100, method='inclusive')
+    return {'p50_ms': round(cortes[49], 3), 'p95_ms': round(cortes[94], 3), 'p99_ms': round(cortes[98], 3)}
+
+def medir_consultas(pedir, urls, hilos):
+    pedir(urls[0][1])  # calentamiento: abre la DB y renderiza la página
+    tiempos = {tipo: [] for tipo, _ in MEZCLA}
+    errores = {tipo: 0 for tipo, _ in MEZCLA}
+
+    def una(item):
+        tipo, url = item
+        t0 = time.perf_counter()
+        estado = pedir(url)
+        return tipo, (time.perf_counter() - t0) * 1000, estado
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        for tipo, ms, estado in pool.map(una, urls):
+            tiempos[tipo].append(ms)
+            if estado >= 500:
+                errores[tipo] += 1
+    total = time.perf_counter() - t0
+
+    resultado = {}
+    for tipo, valores in tiempos.items():
+        resultado[tipo] = {'peticiones': len(valores), 'errores': errores[tipo], **percentiles(valores)}
+    todos = [ms for valores in tiempos.values() for ms in valores]
+    resultado['total'] = {'peticiones': len(todos), 'errores': sum(errores.values()),
+                          'throughput_rps': round(len(todos) / total, 1), **percentiles(todos)}
+    return resultado
+
+
+# --- Comparación entre corridas ---
+
+def metricas_planas(resultado, prefijo=''):
+    for clave, valor in resultado.items():
+        if isinstance(valor, dict):
+            yield from metricas_planas(valor, f"{prefijo}{clave}.")
+        elif isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            yield f"{prefijo}{clave}", valor
+
+def comparar(base, actual):
+    base_plana = dict(metricas_planas({'build': base.get('build', {}), 'consultas': base.get('consultas', {})}))
+    print(f"\n{'métrica':<52} {'base':>10} {'actual':>10} {'cambio':>8}")
+    for clave, valor in metricas_planas({'build': actual.get('build', {}), 'consultas': actual.get('consultas', {})}):
+        anterior = base_plana.get(clave)
+        if not anterior or clave.endswith('.peticiones'):
+            continue
+        print(f"{clave:<52} {anterior:>10} {valor:>10} {(valor - anterior) / anterior * 100:>+7.1f}%")
+
+def commit_actual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--skus', type=int, default=20000)
+    parser.add_argument('--sucursales', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--modos', nargs='*', default=['completo', 'streaming', 'incremental'],
+                        choices=['completo', 'streaming', 'incremental'])
+    parser.add_argument('--peticiones', type=int, default=3000)
+    parser.add_argument('--hilos', type=int, default=8)
+    parser.add_argument('--sin-cache', action='store_true', help="Desactiva la caché de resultados de app.py")
+    parser.add_argument('--url', help="Servidor ya levantado; por defecto se usa el cliente de pruebas de Flask")
+    parser.add_argument('--directorio', help="Directorio de trabajo (por defecto uno temporal que se borra al final)")
+    parser.add_argument('--salida', help="Archivo JSON de resultados (por defecto se imprime)")
+    parser.add_argument('--comparar', help="JSON de una corrida anterior para mostrar la diferencia")
+    args = parser.parse_args()
+
+    directorio = args.directorio or tempfile.mkdtemp(prefix='bench_inventario_')
+    print(f"Directorio de trabajo: {directorio}", file=sys.stderr)
+    try:
+        resultado = {
+            'commit': commit_actual(),
+            'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'nucleos': os.cpu_count(),
+            'parametros': {k: v for k, v in vars(args).items() if k not in ('salida', 'comparar', 'directorio')},
+            'build': {},
+        }
+
+        # Sin modos se reutiliza el catálogo y la DB que ya estén en --directorio
+        modos = args.modos
+        if modos:
+            sucursales = catalogo_sintetico.generar(directorio, args.skus, args.sucursales, args.seed)
+        # El incremental necesita una DB previa y un CSV modificado
+        if modos and modos[0] == 'incremental':
+            modos = ['completo'] + modos
+        for modo in modos:
+            if modo == 'incremental':
+                tocar_una_sucursal(directorio, sucursales[0], args.skus, args.seed)
+            print(f"Build {modo}...", file=sys.stderr)
+            resultado['build'][modo] = medir_build(directorio, modo, sucursales)
+
+        if args.peticiones:
+            print(f"{args.peticiones} peticiones con {args.hilos} hilos...", file=sys.stderr)
+            pedir = cliente_http(args.url) if args.url else cliente_flask(directorio, args.sin_cache)
+            urls = urls_de_prueba(directorio, args.peticiones, args.seed)
+            # Los avisos de app.py van a stderr para no mezclarse con el JSON
+            with contextlib.redirect_stdout(sys.stderr):
+                resultado['consultas'] = medir_consultas(pedir, urls, args.hilos)
+    finally:
+        if not args.directorio and not args.url:
+            shutil.rmtree(directorio, ignore_errors=True)
+
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            f.write(texto + '\n')
+    else:
+        print(texto)
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            comparar(json.load(f), resultado)
+
+if __name__ == "__main__":
+    if len(sys.argv) == 6 and sys.argv[1] == '--build-hijo':
+        _, _, directorio, modo, sucursales, salida = sys.argv
+        build_hijo(directorio, modo, sucursales.split(','), salida)
+    else:
+        main()
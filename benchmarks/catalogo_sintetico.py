@@ -0,0 +1,104 @@
+"""
+Genera CSV de sucursales sintéticos con el mismo formato que los reales
+(desc_prod2,cve_prod,desc_prod,Inv,Clasificacion, latin-1), para medir
+build_index.py y app.py con catálogos de cualquier tamaño.
+
+Incluye lo que aparece en los archivos reales: existencias sucias ("1,250.5 pz",
+"-", "s/n", vacías), espacios sobrantes, filas sin código, códigos repetidos
+dentro de un archivo, comas dentro de la descripción y, en 'ex', el formato
+ancho con decenas de columnas vacías al final de cada línea.
+
+Uso (escribe hi.csv, ex.csv, ... en el directorio indicado):
+    python benchmarks/catalogo_sintetico.py DIRECTORIO [--skus 20000] [--sucursales 5]
+"""
+import argparse
+import csv
+import os
+import random
+
+ENCABEZADO = ['desc_prod2', 'cve_prod', 'desc_prod', 'Inv', 'Clasificacion']
+
+# Los cinco primeros coinciden con SUCURSALES_ORDEN de app.py; las demás solo
+# sirven para medir el build con más sucursales.
+NOMBRES_SUCURSALES = ['hi', 'ex', 'mt', 'sa', 'ade']
+
+# Archivos que se escriben con el formato ancho de ex.csv (comas al final)
+SUCURSALES_ANCHAS = {'ex'}
+COLUMNAS_VACIAS_ANCHO = 140
+
+PRODUCTOS = ['MARTILLO', 'TORNILLO', 'PIJA', 'CABLE', 'CINTA AISLANTE', 'BROCA', 'LLAVE ALLEN',
+             'PINZA', 'TUBO PVC', 'CODO', 'CUÑA P/RESANAR', 'DESARMADOR', 'FLEXÓMETRO', 'TAQUETE',
+             'BISAGRA', 'CANDADO', 'MANGUERA', 'LIJA', 'BROCHA', 'NIVEL']
+MEDIDAS = ['1/4', '3/8', '1/2', '3/4', '1"', 'NO 10', 'NO 12', '16 OZ', '3 X 4', '25 MTS', '']
+MARCAS = ['TRUPER', 'PRETUL', 'FIERO', 'SKY-FORT', 'URREA', 'FOSET']
+CLASIFICACIONES = ['A', 'B', 'C', 'Sin Mov', 'Sin Mov', 'Sin Mov', ' ', '']
+EXISTENCIAS_SUCIAS = ['1,250.5 pz', '-', 's/n', '', '1.2.3', ' 12 ', '-.']
+
+
+def nombres_sucursales(n):
+    return (NOMBRES_SUCURSALES + [f"s{i}" for i in range(len(NOMBRES_SUCURSALES) + 1, n + 1)])[:n]
+
+def catalogo(skus, rng):
+    """[(desc_prod2, cve_prod, desc_prod)] únicos por código."""
+    productos = []
+    for i in range(skus):
+        marca = rng.choice(MARCAS)
+        nombre = rng.choice(PRODUCTOS)
+        medida = rng.choice(MEDIDAS)
+        modelo = f"{nombre[:3]}-{i}{rng.choice('PXN')}"
+        codigo = f"{marca[:3]} {modelo}"
+        descripcion = ' '.join(p for p in (nombre, medida, modelo, marca) if p)
+        if rng.random() < 0.05:
+            descripcion += ", USO RUDO"  # Coma dentro del campo: va entre comillas
+        desc2 = rng.choice([str(rng.randint(1000, 99999)), f"{modelo}C", ''])
+        productos.append((desc2, codigo, descripcion))
+    return productos
+
+def existencia(rng, sucio):
+    if rng.random() < sucio:
+        return rng.choice(EXISTENCIAS_SUCIAS)
+    valor = max(-20, int(rng.gauss(8, 25)))
+    return str(valor) if rng.random() < 0.95 else f"{valor + rng.random():.3f}"
+
+def escribir_sucursal(path, productos, rng, ancho=False, cobertura=0.9, sucio=0.03):
+    """Escribe un CSV de sucursal con una fracción 'cobertura' del catálogo."""
+    relleno = [''] * (COLUMNAS_VACIAS_ANCHO if ancho else 0)
+    with open(path, 'w', newline='', encoding='latin-1', errors='replace') as f:
+        writer = csv.writer(f)
+        writer.writerow(ENCABEZADO + relleno)
+        for desc2, codigo, descripcion in productos:
+            if rng.random() > cobertura:
+                continue
+            if rng.random() < 0.01:
+                codigo = f"  {codigo} "
+            fila = [desc2, codigo, descripcion, existencia(rng, sucio), rng.choice(CLASIFICACIONES)]
+            writer.writerow(fila + relleno)
+            if rng.random() < 0.005:  # Mismo código dos veces: el build suma las existencias
+                writer.writerow([desc2, codigo, descripcion, existencia(rng, sucio), fila[4]] + relleno)
+            if rng.random() < 0.002:
+                writer.writerow(['', '', 'FILA SIN CODIGO', '5', 'A'] + relleno)
+
+def generar(directorio, skus=20000, sucursales=5, seed=0, sucio=0.03):
+    """Escribe un CSV por sucursal en 'directorio'. Devuelve la lista de sucursales."""
+    os.makedirs(directorio, exist_ok=True)
+    rng = random.Random(seed)
+    productos = catalogo(skus, rng)
+    nombres = nombres_sucursales(sucursales)
+    for nombre in nombres:
+        escribir_sucursal(os.path.join(directorio, f"{nombre}.csv"), productos, rng,
+                          ancho=nombre in SUCURSALES_ANCHAS, sucio=sucio)
+    return nombres
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('directorio')
+    parser.add_argument('--skus', type=int, default=20000)
+    parser.add_argument('--sucursales', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sucio', type=float, default=0.03, help="Fracción de existencias sucias")
+    args = parser.parse_args()
+    nombres = generar(args.directorio, args.skus, args.sucursales, args.seed, args.sucio)
+    print(f"Escritos {len(nombres)} archivos en {args.directorio}: {', '.join(f'{n}.csv' for n in nombres)}")
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,26 @@
-import pandas as pd
 import sqlite3
 import os
+import argparse
+import contextlib
+import cProfile
+import csv
 import datetime
+import hashlib
+import io
+import itertools
+import json
+import math
+import pickle
+import pstats
 import re
+import sys
+import time
+import tracemalloc
 import glob # Para buscar los archivos CSV
+from concurrent.futures import ProcessPoolExecutor
+
+# pandas se importa dentro de las funciones que lo usan: el modo --streaming
+# solo necesita la librería estándar y así puede correr en equipos pequeños.
 
 # --- CONFIGURACIÓN ---
 DB_PATH = "inventario.db"
@@ -18,125 +35,882 @@ COL_NOMBRES_CSV = {
     'DescProd2': 'desc_prod2',
     'Clasificacion': 'Clasificacion'
 }
+
+# Tabla donde se guarda la huella (tamaño, mtime, hash) de cada CSV ingerido,
+# para que el modo incremental sepa qué sucursales cambiaron.
+META_TABLE = "archivos_fuente"
+
+# Cada build se escribe primero en este archivo temporal (mismo directorio que
+# DB_PATH) y solo se renombra sobre DB_PATH cuando pasa la validación, para que
+# la app nunca vea una DB a medio escribir.
+DB_TMP_PATH = DB_PATH + ".tmp"
+
+# Opciones de la tabla FTS5 'inventario' (external content sobre 'productos').
+# prefix='1 2 3' agrega índices de prefijos cortos: /search convierte cada
+# palabra en un prefijo ("martillo 1" -> "martillo"* "1"*) y sin ellos un prefijo
+# de 1-3 letras recorre todos los términos que empiezan así.
+# detail=full permite consultas de frase. Ver benchmarks/bench_fts.py.
+FTS_OPCIONES = "content='productos', content_rowid='id', prefix='1 2 3', detail=full"
+
+# Segundo índice FTS5 con el tokenizer trigram sobre Codigo y DescProd2: permite
+# buscar cualquier subcadena de 3+ caracteres ("UN -43" dentro de "TRU CUN -43P")
+# usando el índice, y sirve para generar candidatos en la búsqueda aproximada.
+FTS_TRIGRAMA_OPCIONES = "content='productos', content_rowid='id', tokenize='trigram'"
+
+# Procesos para leer y limpiar los CSV en paralelo (uno por archivo como máximo).
+# None = uno por núcleo; se puede cambiar con --workers.
+BUILD_WORKERS = None
+
+# Los builds completos cargan primero este archivo sin journal ni fsync y lo
+# compactan con VACUUM INTO sobre DB_TMP_PATH (ver abrir_db_carga).
+DB_CARGA_PATH = DB_TMP_PATH + ".carga"
+CACHE_CARGA_KIB = 256 * 1024  # Caché de páginas durante la carga (KiB)
+
+# Reporte JSON con tiempos, memoria y conteos de cada build (ver PerfilBuild)
+REPORTE_BUILD_PATH = os.path.splitext(DB_PATH)[0] + "_build.json"
+
+# Historial de existencias: DB aparte que sobrevive a los builds y guarda solo
+# las celdas (Codigo, Sucursal) que cambiaron en cada uno, con una copia
+# completa cada HISTORIAL_CHECKPOINT_CADA builds (ver registrar_historial).
+HISTORIAL_PATH = os.path.splitext(DB_PATH)[0] + "_historial.db"
+HISTORIAL_CHECKPOINT_CADA = 50
+
+# Caché de lectura: el DataFrame ya limpio de cada sucursal se guarda con pickle
+# en este directorio, con el SHA-256 del CSV en el nombre. Una sucursal cuyo CSV
+# no cambió se carga en milisegundos en vez de volver a tokenizarlo y limpiarlo.
+# Borrar el directorio vacía la caché.
+CACHE_LECTURA_DIR = os.path.splitext(DB_PATH)[0] + "_cache"
+# Subir este número al cambiar la limpieza (leer_sucursal, clean_*): invalida la caché
+VERSION_LECTURA = 1
 # --- FIN CONFIGURACIÓN ---
 
 
-def clean_text(value):
-    """Convierte a string, quita espacios y maneja None."""
-    return str(value).strip() if pd.notna(value) else ""
+# Lo que queda de una existencia tras quitar todo lo que no sea dígito, '.' o '-'
+# solo es un número válido si cumple este patrón (mismo criterio que float()).
+PATRON_NUMERO = r"-?(?:\d+(?:\.\d*)?|\.\d+)"
+
+def por_valores_unicos(serie, fn):
+    """
+    Aplica fn (una función vectorizada sobre Series) solo a los valores distintos
+    de la serie y reparte el resultado; las existencias y clasificaciones se
+    repiten muchísimo, así que limpiar cada valor una sola vez ahorra la mayor
+    parte del trabajo. Los NaN llegan a fn como NaN.
+    """
+    import pandas as pd
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=False)
+    resultado = fn(pd.Series(unicos, dtype=serie.dtype))
+    if isinstance(resultado, tuple):
+        return tuple(pd.Series(r.to_numpy()[codigos], index=serie.index) for r in resultado)
+    return pd.Series(resultado.to_numpy()[codigos], index=serie.index)
+
+def clean_text(serie):
+    """Convierte a string, quita espacios y maneja None (vectorizado sobre toda la columna)."""
+    return serie.fillna("").astype(str).str.strip()
+
+def _clean_existence(serie):
+    texto = serie.fillna("").astype(str).str.strip().str.replace(r"[^0-9.-]", "", regex=True)
+    validos = texto.str.fullmatch(PATRON_NUMERO).fillna(False).astype(bool)
+    # '-', '.' y '-.' se toman como 0 sin aviso, igual que los vacíos originales (NaN)
+    invalidos = ~validos & ~(serie.isna() | texto.isin(['-', '.', '-.']))
+    # astype(float) convierte igual que float(); pd.to_numeric redondea distinto
+    # algunos decimales largos en el último bit.
+    return texto.where(validos, "0").astype(float), invalidos
+
+def clean_existence(serie):
+    """
+    Limpia la existencia: quita caracteres no numéricos (excepto '.' y '-') y convierte a float.
+    Vectorizado sobre toda la columna; devuelve (existencias, valores_invalidos), donde
+    valores_invalidos son los textos que no se pudieron convertir y quedaron en 0.
+    """
+    existencias, invalidos = por_valores_unicos(serie, _clean_existence)
+    return existencias.astype(float), serie[invalidos.astype(bool)]
 
-def clean_existence(value):
-    """Limpia la existencia: quita caracteres no numéricos (excepto '.') y convierte a float."""
-    if pd.isna(value):
-        return 0.0
-    text_value = str(value).strip()
-    cleaned_text = re.sub(r"[^0-9.-]", "", text_value)
-    if cleaned_text in ['-', '.', '-.']:
-         return 0.0
+# --- HUELLAS DE ARCHIVOS (modo incremental) ---
+
+def hash_archivo(file_path):
+    """SHA-256 del contenido del archivo, leído por bloques."""
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+def huella_archivo(file_path, anterior=None):
+    """
+    Devuelve (tamaño, mtime, hash) del archivo. Si el tamaño y el mtime coinciden
+    con la huella anterior se reutiliza su hash sin volver a leer el archivo.
+    """
+    st = os.stat(file_path)
+    if anterior is not None and anterior[0] == st.st_size and anterior[1] == st.st_mtime_ns:
+        return anterior
+    return (st.st_size, st.st_mtime_ns, hash_archivo(file_path))
+
+def leer_huellas(conn):
+    """Huellas guardadas en la DB: {sucursal: (tamaño, mtime, hash)}. None si no hay tabla."""
+    existe = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (META_TABLE,)
+    ).fetchone()
+    if not existe:
+        return None
+    return {
+        suc: (size, mtime, sha)
+        for suc, size, mtime, sha in conn.execute(f"SELECT Sucursal, Tamano, Mtime, Hash FROM {META_TABLE}")
+    }
+
+def guardar_huellas(cur, huellas):
+    cur.execute(f"CREATE TABLE IF NOT EXISTS {META_TABLE} (Sucursal TEXT PRIMARY KEY, Archivo TEXT, Tamano INTEGER, Mtime INTEGER, Hash TEXT, Actualizado TEXT);")
+    ahora = datetime.datetime.now().isoformat(timespec='seconds')
+    cur.executemany(
+        f"INSERT OR REPLACE INTO {META_TABLE} (Sucursal, Archivo, Tamano, Mtime, Hash, Actualizado) VALUES (?, ?, ?, ?, ?, ?);",
+        [(suc, f"{suc.lower()}.csv", *huella, ahora) for suc, huella in huellas.items()]
+    )
+
+
+def columnas_relleno(linea):
+    """
+    Columnas vacías al final de una línea de encabezado. ex.csv trae así ~150
+    columnas de relleno en cada línea, que triplican su tamaño sin aportar datos.
+    """
+    cuerpo = linea.rstrip('\r\n')
+    return len(cuerpo) - len(cuerpo.rstrip(','))
+
+def sin_relleno(lineas, relleno):
+    """Quita de cada línea las 'relleno' comas finales del formato ancho (si las trae)."""
+    cola = ',' * relleno
+    for linea in lineas:
+        cuerpo = linea.rstrip('\r\n')
+        if cuerpo.endswith(cola):
+            linea = cuerpo[:-relleno] + linea[len(cuerpo):]
+        yield linea
+
+
+# --- CACHÉ DE LECTURA ---
+
+def ruta_cache_lectura(suc_code, sha):
+    return os.path.join(CACHE_LECTURA_DIR, f"{suc_code}-{sha[:32]}-v{VERSION_LECTURA}.pkl")
+
+def leer_cache_lectura(suc_code, sha):
+    """DataFrame limpio guardado para ese contenido del CSV, o None si no hay."""
+    ruta = ruta_cache_lectura(suc_code, sha)
     try:
-        return float(cleaned_text)
-    except ValueError:
-        print(f"WARN: No se pudo convertir existencia '{value}' a número. Usando 0.")
-        return 0.0
+        with open(ruta, 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"⚠️  WARN: No se pudo leer la caché '{ruta}' ({e}). Se vuelve a leer el CSV.")
+        return None
 
-def main():
-    print("=" * 60)
-    print(" BUSCADOR DE INVENTARIO (v11 - Lector CSV Limpio por Nombres)")
-    print("=" * 60)
+def guardar_cache_lectura(suc_code, sha, df):
+    """Guarda el DataFrame limpio y borra las entradas anteriores de la sucursal."""
+    ruta = ruta_cache_lectura(suc_code, sha)
+    try:
+        os.makedirs(CACHE_LECTURA_DIR, exist_ok=True)
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, 'wb') as f:
+            pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporal, ruta)
+        for anterior in glob.glob(os.path.join(CACHE_LECTURA_DIR, f"{suc_code}-*.pkl")):
+            if anterior != ruta:
+                os.remove(anterior)
+    except OSError as e:
+        print(f"⚠️  WARN: No se pudo guardar la caché de {suc_code.upper()} ({e}).")
 
-    # --- [1/3] LEYENDO ARCHIVOS CSV ---
-    print(f"[1/3] Buscando archivos {', '.join(SUCURSALES_FILES)}...")
 
-    all_sucursal_data = []
-    found_files_count = 0
-    
+# --- PERFIL DEL BUILD ---
+
+def rss_mb():
+    """Memoria residente actual del proceso en MB (pico si no hay /proc)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return round(int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20, 1)
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+class PerfilBuild:
+    """
+    Tiempos, memoria y conteos de cada fase de un build. Se guarda como JSON en
+    REPORTE_BUILD_PATH. Con herramienta='cprofile' o 'tracemalloc' el reporte
+    incluye además los puntos calientes de CPU o de memoria.
+    """
+
+    def __init__(self, modo, herramienta=None):
+        self.modo = modo
+        self.herramienta = herramienta
+        self.inicio = datetime.datetime.now().isoformat(timespec='seconds')
+        self.t0 = time.perf_counter()
+        self.fases = []
+        self.pila = []
+        self.filas = {}
+        self.archivos = {}
+        self.perfilador = None
+        self.snapshot = None
+        self.traced_max = 0
+        if herramienta == 'cprofile':
+            self.perfilador = cProfile.Profile()
+            self.perfilador.enable()
+        elif herramienta == 'tracemalloc':
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def fase(self, nombre):
+        """Mide el bloque como una fase; las fases anidadas se nombran 'padre/hija'."""
+        self.pila.append(nombre)
+        registro = {'fase': '/'.join(self.pila)}
+        self.fases.append(registro)
+        t0 = time.perf_counter()
+        try:
+            yield registro
+        finally:
+            self.pila.pop()
+            self._cerrar(registro, time.perf_counter() - t0)
+            registro['rss_mb'] = rss_mb()
+            if tracemalloc.is_tracing():
+                actual, _ = tracemalloc.get_traced_memory()
+                registro['tracemalloc_mb'] = round(actual / 2**20, 1)
+                if actual >= self.traced_max:
+                    self.traced_max = actual
+                    self.snapshot = tracemalloc.take_snapshot()
+
+    def agregar_fase(self, nombre, segundos, **datos):
+        """Fase medida en otro proceso (por ejemplo la lectura de un CSV en el pool)."""
+        registro = {'fase': '/'.join(self.pila + [nombre]), **datos}
+        self.fases.append(registro)
+        self._cerrar(registro, segundos)
+
+    def _cerrar(self, registro, segundos):
+        registro['segundos'] = round(segundos, 4)
+        if registro.get('filas') and segundos > 0:
+            registro['filas_por_s'] = round(registro['filas'] / segundos)
+
+    def puntos_calientes(self, n=25):
+        if self.perfilador is not None:
+            self.perfilador.disable()
+            self.perfilador.dump_stats(os.path.splitext(REPORTE_BUILD_PATH)[0] + ".prof")
+            stats = pstats.Stats(self.perfilador).stats
+            ordenadas = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:n]
+            return [
+                {'funcion': f"{os.path.basename(archivo)}:{linea}({funcion})", 'llamadas': llamadas,
+                 'tottime_s': round(tottime, 4), 'cumtime_s': round(cumtime, 4)}
+                for (archivo, linea, funcion), (_, llamadas, tottime, cumtime, _) in ordenadas
+            ]
+        if self.snapshot is not None:
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.filas.setdefault('tracemalloc_pico_mb', round(pico / 2**20, 1))
+            return [
+                {'linea': str(stat.traceback[0]), 'kib': stat.size // 1024, 'bloques': stat.count}
+                for stat in self.snapshot.statistics('lineno')[:n]
+            ]
+        return None
+
+    def guardar(self, generacion, publicada):
+        """Escribe el reporte JSON junto a la DB. Incluye los tamaños finales si se publicó."""
+        reporte = {
+            'modo': self.modo,
+            'generacion': generacion,
+            'publicada': publicada,
+            'inicio': self.inicio,
+            'total_s': round(time.perf_counter() - self.t0, 3),
+            'rss_pico_mb': max([f['rss_mb'] for f in self.fases if 'rss_mb' in f] + [rss_mb()]),
+            'filas': self.filas,
+            'archivos': self.archivos,
+            'fases': self.fases,
+        }
+        if publicada:
+            conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+            try:
+                reporte['db'] = {
+                    'bytes': os.path.getsize(DB_PATH),
+                    'fts_bytes': {tabla: tamano_fts(conn, tabla) for tabla in ('inventario', 'productos_trigrama')},
+                }
+            finally:
+                conn.close()
+        calientes = self.puntos_calientes()
+        if calientes is not None:
+            reporte['puntos_calientes'] = {'herramienta': self.herramienta, 'top': calientes}
+        with open(REPORTE_BUILD_PATH, 'w', encoding='utf-8') as f:
+            json.dump(reporte, f, indent=2, ensure_ascii=False)
+        print(f"   INFO: Reporte del build en '{REPORTE_BUILD_PATH}' ({reporte['total_s']} s, pico {reporte['rss_pico_mb']} MB).")
+        return reporte
+
+
+# --- PUBLICACIÓN ATÓMICA DE LA DB ---
+
+def leer_generacion(conn):
+    """Número de generación guardado en 'build_info' (0 si la DB no lo tiene)."""
+    try:
+        row = conn.execute("SELECT Generacion FROM build_info").fetchone()
+    except sqlite3.Error:
+        return 0
+    return row[0] if row else 0
+
+def guardar_generacion(cur, generacion, modo):
+    cur.execute("CREATE TABLE IF NOT EXISTS build_info (Generacion INTEGER, Construido TEXT, Modo TEXT);")
+    cur.execute("DELETE FROM build_info;")
+    cur.execute(
+        "INSERT INTO build_info (Generacion, Construido, Modo) VALUES (?, ?, ?);",
+        (generacion, datetime.datetime.now().isoformat(timespec='seconds'), modo)
+    )
+
+def siguiente_generacion():
+    """Generación de la DB publicada actualmente + 1."""
+    if not os.path.exists(DB_PATH):
+        return 1
+    conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+    try:
+        return leer_generacion(conn) + 1
+    finally:
+        conn.close()
+
+def borrar_temporal():
+    for path in (DB_TMP_PATH, DB_TMP_PATH + "-journal", DB_CARGA_PATH, DB_CARGA_PATH + "-journal"):
+        if os.path.exists(path):
+            os.remove(path)
+
+def validar_db(path):
+    """
+    Comprueba que la DB recién construida se pueda servir: integridad, datos en
+    inventario_plain y un producto con su entrada FTS por cada fila Global.
+    Devuelve None si es válida o un mensaje con el problema.
+    """
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        check = conn.execute("PRAGMA quick_check;").fetchone()[0]
+        if check != 'ok':
+            return f"quick_check falló: {check}"
+        total = conn.execute("SELECT COUNT(*) FROM inventario_plain").fetchone()[0]
+        if total == 0:
+            return "inventario_plain está vacía"
+        globales = conn.execute("SELECT COUNT(*) FROM inventario_plain WHERE Sucursal = 'Global'").fetchone()[0]
+        productos = conn.execute("SELECT COUNT(*) FROM productos").fetchone()[0]
+        fts = conn.execute("SELECT COUNT(*) FROM inventario_docsize").fetchone()[0]
+        trigramas = conn.execute("SELECT COUNT(*) FROM productos_trigrama_docsize").fetchone()[0]
+        if not globales == productos == fts == trigramas:
+            return f"{globales} filas Global, {productos} productos, {fts} entradas FTS y {trigramas} entradas trigrama"
+        pivote = conn.execute("SELECT COUNT(*) FROM existencias").fetchone()[0]
+        if globales != pivote:
+            return f"{globales} filas Global pero {pivote} filas en 'existencias'"
+        resumidos = conn.execute("SELECT COALESCE(SUM(Productos), 0) FROM resumen WHERE Sucursal = 'Global'").fetchone()[0]
+        if globales != resumidos:
+            return f"{globales} filas Global pero {resumidos} productos Global en 'resumen'"
+        if leer_generacion(conn) == 0:
+            return "falta build_info"
+        return None
+    except sqlite3.Error as e:
+        return f"error al leer la DB: {e}"
+    finally:
+        conn.close()
+
+def publicar_db():
+    """Valida DB_TMP_PATH y la renombra atómicamente sobre DB_PATH. Devuelve True si se publicó."""
+    problema = validar_db(DB_TMP_PATH)
+    if problema:
+        print(f"❌ La DB nueva no pasó la validación ({problema}). Se conserva la anterior.")
+        borrar_temporal()
+        return False
+    os.replace(DB_TMP_PATH, DB_PATH)
+    return True
+
+class EscrituraBuild:
+    """
+    Conexión de escritura de un build, desde la carga hasta la publicación:
+
+        with EscrituraBuild(perfil, conn, 'escribir en DB', generacion) as build:
+            ...  # escribir con conn
+            if build.publicar():
+                print("✅ ...")
+
+    publicar() deja los datos en DB_TMP_PATH (compactar_db para la carga masiva,
+    commit para la copia del incremental), cierra la conexión y publica. Al salir
+    del bloque, un error se informa y deshace lo escrito si la conexión sigue
+    abierta, el temporal se borra si no se publicó y se guarda el reporte.
+    """
+
+    def __init__(self, perfil, conn, accion, generacion=None, compactar=True):
+        self.perfil = perfil
+        self.conn = conn
+        self.accion = accion
+        self.generacion = generacion
+        self.compactar = compactar
+        self.publicada = False
+
+    def __enter__(self):
+        return self
+
+    def publicar(self):
+        """Cierra la conexión, publica DB_TMP_PATH y registra el historial. Devuelve True si se publicó."""
+        # Desde aquí la conexión se cierra aunque algo falle: __exit__ ya no debe tocarla
+        conn, self.conn = self.conn, None
+        if self.compactar:
+            with self.perfil.fase('compactacion'):
+                compactar_db(conn)
+        with self.perfil.fase('publicacion'):
+            if not self.compactar:
+                try:
+                    conn.commit()
+                finally:
+                    conn.close()
+            self.publicada = publicar_db()
+        if self.publicada:
+            guardar_historial(self.perfil)
+        return self.publicada
+
+    def __exit__(self, tipo, error, traza):
+        if isinstance(error, sqlite3.Error):
+            print(f"❌ ERROR SQLite: {error}")
+        elif isinstance(error, Exception):
+            print(f"❌ ERROR General al {self.accion}: {error}")
+        if self.conn is not None:
+            if error is not None:
+                self.conn.rollback()
+            self.conn.close()
+        if not self.publicada:
+            borrar_temporal()
+        self.perfil.guardar(self.generacion, self.publicada)
+        return isinstance(error, Exception)
+
+
+# --- HISTORIAL DE EXISTENCIAS ---
+
+def crear_tablas_historial(conn):
+    """
+    snapshots: un registro por build publicado (Completo = 1 en los checkpoints).
+    cambios:   (Codigo, Snapshot, Sucursal) -> Existencia y Clasificacion nuevas;
+               Existencia NULL = el código dejó de aparecer en esa sucursal. La
+               clave empieza por Codigo para leer la historia de un producto
+               con un solo recorrido de rango.
+    estado:    última Existencia y Clasificacion registradas de cada celda,
+               contra la que se calcula el siguiente delta.
+    """
+    conn.execute("CREATE TABLE IF NOT EXISTS snapshots (Snapshot INTEGER PRIMARY KEY, Generacion INTEGER, Construido TEXT, Completo INTEGER);")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS cambios (Codigo TEXT, Snapshot INTEGER, Sucursal TEXT, Existencia TEXT, "
+        "Clasificacion TEXT, PRIMARY KEY (Codigo, Snapshot, Sucursal)) WITHOUT ROWID;"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS estado (Codigo TEXT, Sucursal TEXT, Existencia TEXT, Clasificacion TEXT, "
+        "PRIMARY KEY (Codigo, Sucursal)) WITHOUT ROWID;"
+    )
+
+def registrar_historial():
+    """
+    Agrega la DB recién publicada al historial: las celdas nuevas, modificadas
+    o que desaparecieron desde el build anterior, o todas si toca checkpoint.
+    Devuelve (snapshot, celdas escritas). Va después de publicar: si falla, el
+    build ya está servido y el siguiente delta incluye también estos cambios.
+    """
+    conn = sqlite3.connect(f"file:{HISTORIAL_PATH}", uri=True)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL;")  # La app lee el historial mientras se escribe
+        crear_tablas_historial(conn)
+        conn.execute("ATTACH DATABASE ? AS nueva;", (f"file:{DB_PATH}?mode=ro",))
+        generacion, construido = conn.execute("SELECT Generacion, Construido FROM nueva.build_info").fetchone()
+        ultimo, ultimo_checkpoint = conn.execute(
+            "SELECT MAX(Snapshot), MAX(CASE WHEN Completo THEN Snapshot END) FROM snapshots"
+        ).fetchone()
+        completo = ultimo_checkpoint is None or ultimo - ultimo_checkpoint + 1 >= HISTORIAL_CHECKPOINT_CADA
+
+        with conn:
+            snapshot = conn.execute(
+                "INSERT INTO snapshots (Generacion, Construido, Completo) VALUES (?, ?, ?);",
+                (generacion, construido, int(completo))
+            ).lastrowid
+            # Celdas que desaparecieron (también en los checkpoints, que si no
+            # las omitirían sin más y quien lea desde ahí no vería la baja)
+            escritas = conn.execute(
+                "INSERT INTO cambios SELECT e.Codigo, ?, e.Sucursal, NULL, NULL FROM estado e WHERE NOT EXISTS "
+                "(SELECT 1 FROM nueva.inventario_plain n WHERE n.Codigo = e.Codigo AND n.Sucursal = e.Sucursal);",
+                (snapshot,)
+            ).rowcount
+            if completo:
+                conn.execute("DELETE FROM estado;")
+                conn.execute("INSERT INTO estado SELECT Codigo, Sucursal, Existencia, Clasificacion FROM nueva.inventario_plain;")
+                escritas += conn.execute(
+                    "INSERT INTO cambios SELECT Codigo, ?, Sucursal, Existencia, Clasificacion FROM estado;", (snapshot,)
+                ).rowcount
+            else:
+                conn.execute("DROP TABLE IF EXISTS temp.delta;")
+                conn.execute(
+                    "CREATE TEMP TABLE delta AS "
+                    "SELECT n.Codigo, n.Sucursal, n.Existencia, n.Clasificacion FROM nueva.inventario_plain n "
+                    "LEFT JOIN estado e ON e.Codigo = n.Codigo AND e.Sucursal = n.Sucursal "
+                    "WHERE e.Codigo IS NULL OR e.Existencia IS NOT n.Existencia OR e.Clasificacion IS NOT n.Clasificacion;"
+                )
+                escritas += conn.execute(
+                    "INSERT INTO cambios SELECT Codigo, ?, Sucursal, Existencia, Clasificacion FROM delta;", (snapshot,)
+                ).rowcount
+                conn.execute(
+                    "DELETE FROM estado WHERE NOT EXISTS "
+                    "(SELECT 1 FROM nueva.inventario_plain n WHERE n.Codigo = estado.Codigo AND n.Sucursal = estado.Sucursal);"
+                )
+                conn.execute("INSERT OR REPLACE INTO estado SELECT * FROM delta;")
+                conn.execute("DROP TABLE delta;")
+        return snapshot, escritas
+    finally:
+        conn.close()
+
+def guardar_historial(perfil):
+    """registrar_historial() dentro de la fase 'historial', sin hacer fallar el build."""
+    with perfil.fase('historial'):
+        try:
+            snapshot, escritas = registrar_historial()
+        except sqlite3.Error as e:
+            print(f"⚠️  WARN: No se pudo registrar el historial en '{HISTORIAL_PATH}': {e}")
+            return
+    print(f"   INFO: Historial: snapshot {snapshot} con {escritas} celdas en '{HISTORIAL_PATH}'.")
+
+
+# --- CARGA MASIVA ---
+
+def abrir_db_carga(journal='OFF', cache_kib=CACHE_CARGA_KIB, temp_en_memoria=True):
+    """
+    Conexión a DB_CARGA_PATH (archivo nuevo) ajustada para carga masiva. Nadie
+    lee ese archivo hasta que se compacta y publica, así que no necesita journal
+    ni fsync: si el build se interrumpe, borrar_temporal() lo descarta.
+    """
+    for path in (DB_CARGA_PATH, DB_CARGA_PATH + "-journal"):
+        if os.path.exists(path):
+            os.remove(path)
+    conn = sqlite3.connect(DB_CARGA_PATH)
+    conn.execute(f"PRAGMA journal_mode = {journal};")
+    conn.execute("PRAGMA synchronous = OFF;")
+    conn.execute("PRAGMA locking_mode = EXCLUSIVE;")
+    if cache_kib:
+        conn.execute(f"PRAGMA cache_size = -{cache_kib};")
+    if temp_en_memoria:
+        conn.execute("PRAGMA temp_store = MEMORY;")
+    return conn
+
+def compactar_db(conn):
+    """
+    Cierra la carga: ANALYZE para que el planificador conozca la distribución de
+    los índices y VACUUM INTO DB_TMP_PATH para publicar un archivo sin páginas
+    libres y con cada tabla contigua. Cierra 'conn' aunque falle y borra DB_CARGA_PATH.
+    """
+    try:
+        conn.execute("ANALYZE;")
+        conn.commit()
+        conn.execute("VACUUM INTO ?;", (DB_TMP_PATH,))
+    finally:
+        conn.close()
+    os.remove(DB_CARGA_PATH)
+
+
+# --- LECTURA Y AGRUPACIÓN ---
+
+def leer_sucursal(suc_code):
+    """
+    Lee y limpia el CSV de una sucursal. Devuelve el DataFrame limpio con la
+    columna 'Sucursal', o None si el archivo no existe, no tiene datos válidos
+    o no se pudo procesar. Si ya se limpió antes un CSV con el mismo contenido
+    lo toma de la caché de lectura.
+    """
+    file_path = f"{suc_code}.csv"
+    if not os.path.exists(file_path):
+        print(f"⚠️  WARN: No se encontró el archivo '{file_path}'. Saltando sucursal.")
+        return None
+
+    print(f" - Leyendo archivo: {file_path} (Sucursal: {suc_code.upper()}) ...")
+
+    # pandas se importa antes de empezar a medir la lectura (también la hace el
+    # unpickle de la caché): la primera importación de cada proceso tarda más que
+    # leer un archivo y se reporta como fase propia.
+    ya_importado = 'pandas' in sys.modules
+    t_import = time.perf_counter()
+    import pandas as pd
+    import_pandas_s = 0.0 if ya_importado else time.perf_counter() - t_import
+
+    # El hash es del contenido que se parsea aquí mismo, no de la huella tomada
+    # antes: si el CSV cambia durante el build, la caché no queda con otro contenido.
+    t0 = time.perf_counter()
+    with open(file_path, 'rb') as f:
+        contenido = f.read()
+    sha = hashlib.sha256(contenido).hexdigest()
+    df = leer_cache_lectura(suc_code, sha)
+    if df is not None:
+        print(f"   INFO: {len(df)} registros válidos desde la caché (el archivo no cambió).")
+        df.attrs['perfil'] = {**df.attrs['perfil'], 'lectura_s': time.perf_counter() - t0, 'limpieza_s': 0.0,
+                               'import_pandas_s': import_pandas_s, 'cache': True}
+        return df
+
     # Nombres de columnas que esperamos encontrar en los CSV
     nombres_columnas_requeridas = list(COL_NOMBRES_CSV.values())
 
-    for suc_code in SUCURSALES_FILES:
-        file_path = f"{suc_code}.csv"
-        if not os.path.exists(file_path):
-            print(f"⚠️  WARN: No se encontró el archivo '{file_path}'. Saltando sucursal.")
-            continue
+    try:
+        # --- LECTURA POR NOMBRE DE COLUMNA ---
+        # header=0 le dice a pandas que la fila 1 es el encabezado
+        df = pd.read_csv(
+            io.BytesIO(contenido),
+            header=0,
+            usecols=nombres_columnas_requeridas, # Leer solo las columnas que necesitamos por nombre
+            encoding='latin1',
+            on_bad_lines='skip',
+            dtype=str
+        )
 
-        print(f" - Leyendo archivo: {file_path} (Sucursal: {suc_code.upper()}) ...")
-        found_files_count += 1
-        
-        try:
-            # --- LECTURA POR NOMBRE DE COLUMNA ---
-            # header=0 le dice a pandas que la fila 1 es el encabezado
-            df = pd.read_csv(
-                file_path,
-                header=0, 
-                usecols=nombres_columnas_requeridas, # Leer solo las columnas que necesitamos por nombre
-                encoding='latin1',
-                on_bad_lines='skip',
-                dtype=str
-            )
+        # Renombrar columnas a nuestro formato estándar (Codigo, Descripcion, etc.)
+        df = df.rename(columns={v: k for k, v in COL_NOMBRES_CSV.items()})
+        t_lectura = time.perf_counter()
 
-            # Renombrar columnas a nuestro formato estándar (Codigo, Descripcion, etc.)
-            df = df.rename(columns={v: k for k, v in COL_NOMBRES_CSV.items()})
-
-            # --- LIMPIEZA DE DATOS ---
-            df['Codigo'] = df['Codigo'].apply(clean_text)
-            df['Descripcion'] = df['Descripcion'].apply(clean_text)
-            df['DescProd2'] = df['DescProd2'].apply(clean_text)
-            df['Clasificacion'] = df['Clasificacion'].apply(clean_text).replace('', 'S/M')
-            df['Existencia'] = df['Existencia'].apply(clean_existence)
-
-            original_rows = len(df)
-            df = df[df['Codigo'] != '']
-            if len(df) < original_rows:
-                print(f"   INFO: Se descartaron {original_rows - len(df)} filas sin código.")
-            
-            if df.empty:
-                print(f"   INFO: No se encontraron datos válidos en el archivo {file_path}.")
-                continue
+        # --- LIMPIEZA DE DATOS ---
+        df['Codigo'] = clean_text(df['Codigo'])
+        df['Descripcion'] = clean_text(df['Descripcion'])
+        df['DescProd2'] = clean_text(df['DescProd2'])
+        df['Clasificacion'] = por_valores_unicos(df['Clasificacion'], clean_text).replace('', 'S/M')
+        df['Existencia'], invalidos = clean_existence(df['Existencia'])
+        if len(invalidos):
+            ejemplos = ', '.join(f"'{v}'" for v in invalidos.unique()[:5])
+            print(f"   WARN: {len(invalidos)} existencias no se pudieron convertir a número y se tomaron como 0 (ej. {ejemplos}).")
 
-            df['Sucursal'] = suc_code.upper()
-            all_sucursal_data.append(df)
-            print(f"   INFO: Leídos {len(df)} registros válidos.")
+        original_rows = len(df)
+        df = df[df['Codigo'] != '']
+        if len(df) < original_rows:
+            print(f"   INFO: Se descartaron {original_rows - len(df)} filas sin código.")
 
-        except Exception as e:
-            print(f"❌ Error procesando el archivo {file_path}: {e}")
-            print("   ASEGÚRATE DE QUE LOS NOMBRES DE ENCABEZADO SEAN: cve_prod, desc_prod, Inv, desc_prod2, Clasificacion")
-            import traceback
-            traceback.print_exc()
+        if df.empty:
+            print(f"   INFO: No se encontraron datos válidos en el archivo {file_path}.")
+            return None
 
-    if not all_sucursal_data:
-        print("❌ No se pudieron leer datos válidos de ningún archivo CSV.")
-        return
+        df['Sucursal'] = suc_code.upper()
+        print(f"   INFO: Leídos {len(df)} registros válidos.")
+        # Viaja con el DataFrame desde el proceso de lectura hasta PerfilBuild
+        df.attrs['perfil'] = {
+            'lectura_s': t_lectura - t0,
+            'limpieza_s': time.perf_counter() - t_lectura,
+            'import_pandas_s': import_pandas_s,
+            'filas_leidas': original_rows,
+            'descartadas_sin_codigo': original_rows - len(df),
+            'existencias_invalidas': len(invalidos),
+            'bytes': len(contenido),
+            'cache': False,
+        }
+        guardar_cache_lectura(suc_code, sha, df)
+        return df
 
-    print(f"✅ Total archivos leídos: {found_files_count}")
-    data_combined = pd.concat(all_sucursal_data, ignore_index=True)
-    print(f"✅ Total registros leídos de todos los CSV: {len(data_combined)}")
+    except Exception as e:
+        print(f"❌ Error procesando el archivo {file_path}: {e}")
+        print("   ASEGÚRATE DE QUE LOS NOMBRES DE ENCABEZADO SEAN: cve_prod, desc_prod, Inv, desc_prod2, Clasificacion")
+        import traceback
+        traceback.print_exc()
+        return None
 
-    # --- [2/3] AGRUPANDO DATOS ---
-    print("\n[2/3] Agrupando datos y calculando Global...")
+def leer_sucursales(suc_codes, workers=None):
+    """
+    Lee y limpia varias sucursales, en paralelo con un proceso por archivo.
+    Devuelve [(suc_code, df o None)] en el mismo orden que suc_codes, para que
+    el 'first' de la agrupación sea idéntico al de una lectura en serie.
+    """
+    workers = min(workers or BUILD_WORKERS or os.cpu_count() or 1, len(suc_codes))
+    if workers <= 1:
+        return [(suc_code, leer_sucursal(suc_code)) for suc_code in suc_codes]
+    print(f"   INFO: Leyendo {len(suc_codes)} archivos con {workers} procesos.")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(zip(suc_codes, pool.map(leer_sucursal, suc_codes)))
 
-    grouped_data = data_combined.groupby(['Codigo', 'Sucursal']).agg(
+def agrupar_por_sucursal(data):
+    """Agrupa por (Codigo, Sucursal): 'first' para los textos y suma de existencias."""
+    return data.groupby(['Codigo', 'Sucursal']).agg(
         Descripcion=('Descripcion', 'first'),
         DescProd2=('DescProd2', 'first'),
         Existencia=('Existencia', 'sum'),
         Clasificacion=('Clasificacion', 'first') # <-- La re-agregamos
     ).reset_index()
 
-    global_stock = grouped_data.groupby('Codigo').agg(
-         Descripcion=('Descripcion', 'first'),
-         DescProd2=('DescProd2', 'first'),
-         Existencia=('Existencia', 'sum'),
-         Clasificacion=('Clasificacion', 'first') # <-- La re-agregamos
-    ).reset_index()
-    global_stock['Sucursal'] = 'Global'
-
-    final_data = pd.concat([grouped_data, global_stock], ignore_index=True)
-
+def formatear_filas(data):
+    """
+    Prepara el DataFrame para la DB: 'Existencia' se guarda como texto entero
+    redondeado y 'ExistenciaNum' conserva la suma sin redondear, que es la que
+    se usa para recalcular Global en el modo incremental.
+    """
+    data = data.copy()
+    data['ExistenciaNum'] = data['Existencia'].astype(float)
     # Agregamos 'Clasificacion' a la lista
     for c in ["Codigo", "Descripcion", "DescProd2", "Existencia", "Clasificacion", "Sucursal"]:
          if c == 'Existencia':
-             final_data[c] = final_data[c].round(0).astype(int).astype(str)
+             data[c] = data[c].round(0).astype(int).astype(str)
          else:
-             final_data[c] = final_data[c].astype(str).fillna("").str.strip()
+             data[c] = data[c].astype(str).fillna("").str.strip()
+    return data
+
+COLUMNAS_PLAIN = ["Codigo", "Descripcion", "DescProd2", "Existencia", "Clasificacion", "Sucursal", "ExistenciaNum"]
+INSERT_PLAIN = "INSERT INTO inventario_plain (Codigo, Descripcion, DescProd2, Existencia, Clasificacion, Sucursal, ExistenciaNum) VALUES (?, ?, ?, ?, ?, ?, ?);"
+CREATE_PLAIN = "CREATE TABLE inventario_plain (Codigo TEXT, Descripcion TEXT, DescProd2 TEXT, Existencia TEXT, Clasificacion TEXT, Sucursal TEXT, ExistenciaNum REAL);"
+
+def crear_tabla_existencias(cur, where=""):
+    """
+    Tabla pivote 'existencias' (WITHOUT ROWID): una fila por Codigo con la
+    existencia entera y la clasificación de cada sucursal y de Global, para que
+    /detalle se resuelva con una sola búsqueda por clave primaria.
+    Con 'where' solo se (re)insertan los códigos que cumplan esa condición.
+    """
+    sucursales = [s.upper() for s in SUCURSALES_FILES] + ['Global']
+    columnas = ["Codigo TEXT PRIMARY KEY", "Descripcion TEXT", "DescProd2 TEXT"]
+    selects = [
+        "Codigo",
+        "MAX(CASE WHEN Sucursal = 'Global' THEN Descripcion END)",
+        "MAX(CASE WHEN Sucursal = 'Global' THEN DescProd2 END)",
+    ]
+    for suc in sucursales:
+        columnas += [f"Existencia_{suc} INTEGER", f"Clasificacion_{suc} TEXT"]
+        selects += [
+            f"MAX(CASE WHEN Sucursal = '{suc}' THEN CAST(Existencia AS INTEGER) END)",
+            f"MAX(CASE WHEN Sucursal = '{suc}' THEN Clasificacion END)",
+        ]
+    cur.execute(f"CREATE TABLE IF NOT EXISTS existencias ({', '.join(columnas)}) WITHOUT ROWID;")
+    cur.execute(
+        f"INSERT INTO existencias SELECT {', '.join(selects)} FROM inventario_plain {where} "
+        "GROUP BY Codigo HAVING COUNT(CASE WHEN Sucursal = 'Global' THEN 1 END) > 0;"
+    )
+
+def crear_tabla_resumen(cur):
+    """
+    Tabla 'resumen' (WITHOUT ROWID): una fila por (Sucursal, Clasificacion),
+    incluida Global, con el número de productos, la suma de existencias y
+    cuántos están en negativo, en cero o con existencia. Usa la existencia
+    entera que muestra /detalle. Son pocas decenas de grupos, así que se
+    reconstruye completa en cada build (también en el incremental).
+    """
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS resumen (Sucursal TEXT, Clasificacion TEXT, Productos INTEGER, "
+        "Existencia INTEGER, Negativos INTEGER, EnCero INTEGER, ConExistencia INTEGER, "
+        "PRIMARY KEY (Sucursal, Clasificacion)) WITHOUT ROWID;"
+    )
+    cur.execute("DELETE FROM resumen;")
+    cur.execute(
+        "INSERT INTO resumen SELECT Sucursal, Clasificacion, COUNT(*), SUM(e), SUM(e < 0), SUM(e = 0), SUM(e > 0) "
+        "FROM (SELECT Sucursal, Clasificacion, CAST(Existencia AS INTEGER) AS e FROM inventario_plain) "
+        "GROUP BY Sucursal, Clasificacion;"
+    )
+
+def crear_indices_y_fts(cur, perfil=None):
+    """Crea los índices de inventario_plain y las tablas FTS a partir de las filas Global."""
+    perfil = perfil or PerfilBuild(None)
+    with perfil.fase('indices'):
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_inv_cod  ON inventario_plain(Codigo, Sucursal);")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_inv_suc  ON inventario_plain(Sucursal);")
+    print("   INFO: Índices creados para 'inventario_plain'.")
+
+    with perfil.fase('existencias'):
+        crear_tabla_existencias(cur)
+    print("   INFO: Tabla pivote 'existencias' creada y poblada.")
+
+    with perfil.fase('resumen'):
+        crear_tabla_resumen(cur)
+    print("   INFO: Tabla 'resumen' por sucursal y clasificación creada.")
+
+    # ---- Tabla FTS5 (Para búsqueda rápida) ----
+    # 'productos' guarda un registro por código y es el contenido externo del
+    # FTS: así el MATCH devuelve Codigo, Descripcion y DescProd2 en una sola consulta.
+    with perfil.fase('productos') as fase:
+        cur.execute("DROP TABLE IF EXISTS inventario;")
+        cur.execute("DROP TABLE IF EXISTS productos;")
+        cur.execute("CREATE TABLE productos (id INTEGER PRIMARY KEY, Codigo TEXT NOT NULL UNIQUE, Descripcion TEXT, DescProd2 TEXT);")
+        cur.execute(
+            "INSERT INTO productos (Codigo, Descripcion, DescProd2) "
+            "SELECT Codigo, Descripcion, DescProd2 FROM inventario_plain WHERE Sucursal = 'Global' ORDER BY Codigo;"
+        )
+        fase['filas'] = cur.rowcount
+    cur.execute(f"CREATE VIRTUAL TABLE inventario USING fts5(Codigo, Descripcion, DescProd2, {FTS_OPCIONES});")
+    cur.execute("DROP TABLE IF EXISTS productos_trigrama;")
+    cur.execute(f"CREATE VIRTUAL TABLE productos_trigrama USING fts5(Codigo, DescProd2, {FTS_TRIGRAMA_OPCIONES});")
+    for tabla in ('inventario', 'productos_trigrama'):
+        with perfil.fase(f'fts_{tabla}'):
+            cur.execute(f"INSERT INTO {tabla} ({tabla}) VALUES ('rebuild');")
+            # Junta todos los segmentos del índice en uno solo
+            cur.execute(f"INSERT INTO {tabla} ({tabla}) VALUES ('optimize');")
+        print(f"   INFO: Tabla FTS '{tabla}' creada y poblada ({tamano_fts(cur, tabla) / 1024:.0f} KB).")
+
+def tamano_fts(cur, tabla):
+    """Bytes que ocupan las tablas internas de un índice FTS5."""
+    internas = [f"{tabla}_{sufijo}" for sufijo in ('data', 'idx', 'docsize', 'config')]
+    return cur.execute(
+        f"SELECT SUM(pgsize) FROM dbstat WHERE name IN ({', '.join('?' for _ in internas)})", internas
+    ).fetchone()[0] or 0
+
+# --- BUILD COMPLETO ---
+
+def registrar_lectura(perfil, suc_code, df):
+    """Pasa al perfil los tiempos y conteos que leer_sucursal dejó en df.attrs."""
+    datos = df.attrs.get('perfil') if df is not None else None
+    if not datos:
+        return
+    archivo = f"{suc_code}.csv"
+    perfil.archivos[archivo] = {k: v for k, v in datos.items() if not k.endswith('_s')}
+    if datos.get('import_pandas_s'):
+        perfil.agregar_fase(f"{archivo}/import_pandas", datos['import_pandas_s'])
+    perfil.agregar_fase(f"{archivo}/read_csv", datos['lectura_s'], filas=datos['filas_leidas'])
+    perfil.agregar_fase(f"{archivo}/limpieza", datos['limpieza_s'], filas=datos['filas_leidas'])
+    for clave in ('filas_leidas', 'descartadas_sin_codigo', 'existencias_invalidas'):
+        perfil.filas[clave] = perfil.filas.get(clave, 0) + datos[clave]
+
+def main(workers=None, herramienta=None):
+    import pandas as pd
+
+    perfil = PerfilBuild('completo', herramienta)
+    if herramienta and (workers or BUILD_WORKERS or os.cpu_count() or 1) > 1:
+        # Los perfiladores solo ven el proceso principal
+        print(f"   INFO: Con --perfil {herramienta} los CSV se leen en serie.")
+        workers = 1
+
+    print("=" * 60)
+    print(" BUSCADOR DE INVENTARIO (v11 - Lector CSV Limpio por Nombres)")
+    print("=" * 60)
+
+    # --- [1/3] LEYENDO ARCHIVOS CSV ---
+    print(f"[1/3] Buscando archivos {', '.join(SUCURSALES_FILES)}...")
+
+    all_sucursal_data = []
+    huellas = {}
+
+    with perfil.fase('lectura') as fase:
+        # Las huellas se toman antes de leer para no perder cambios hechos durante la lectura
+        huellas_previas = {
+            suc_code: huella_archivo(f"{suc_code}.csv")
+            for suc_code in SUCURSALES_FILES if os.path.exists(f"{suc_code}.csv")
+        }
+        for suc_code, df in leer_sucursales(SUCURSALES_FILES, workers):
+            registrar_lectura(perfil, suc_code, df)
+            if df is None:
+                continue
+            huellas[suc_code.upper()] = huellas_previas[suc_code]
+            all_sucursal_data.append(df)
+        fase['filas'] = perfil.filas.get('filas_leidas', 0)
+
+    if not all_sucursal_data:
+        print("❌ No se pudieron leer datos válidos de ningún archivo CSV.")
+        perfil.guardar(None, False)
+        return
+
+    print(f"✅ Total archivos leídos: {len(all_sucursal_data)}")
+    with perfil.fase('concat') as fase:
+        data_combined = pd.concat(all_sucursal_data, ignore_index=True)
+        fase['filas'] = len(data_combined)
+    print(f"✅ Total registros leídos de todos los CSV: {len(data_combined)}")
+
+    # --- [2/3] AGRUPANDO DATOS ---
+    print("\n[2/3] Agrupando datos y calculando Global...")
+
+    with perfil.fase('agrupacion_sucursal') as fase:
+        fase['filas'] = len(data_combined)
+        grouped_data = agrupar_por_sucursal(data_combined)
+
+    with perfil.fase('agregacion_global') as fase:
+        fase['filas'] = len(grouped_data)
+        global_stock = grouped_data.groupby('Codigo').agg(
+             Descripcion=('Descripcion', 'first'),
+             DescProd2=('DescProd2', 'first'),
+             Existencia=('Existencia', 'sum'),
+             Clasificacion=('Clasificacion', 'first') # <-- La re-agregamos
+        ).reset_index()
+        global_stock['Sucursal'] = 'Global'
+
+    with perfil.fase('formateo') as fase:
+        final_data = formatear_filas(pd.concat([grouped_data, global_stock], ignore_index=True))
+        fase['filas'] = len(final_data)
+    perfil.filas['finales'] = len(final_data)
+    perfil.filas['codigos'] = len(global_stock)
 
     print(f"✅ Total de registros finales para DB: {len(final_data)}")
     print("   Ejemplo de datos finales:")
@@ -144,51 +918,458 @@ def main():
 
     # --- [3/3] CONSTRUYENDO DB SQLITE ---
     print(f"\n[3/3] Construyendo base de datos SQLite ('{DB_PATH}')...")
-    
-    if os.path.exists(DB_PATH):
-        try:
-            os.remove(DB_PATH)
-            print(f"   INFO: Base de datos '{DB_PATH}' existente eliminada.")
-        except OSError as e:
-            print(f"⚠️ WARN: No se pudo eliminar la base de datos existente: {e}")
 
-    conn = sqlite3.connect(DB_PATH)
-    try:
+    # La DB publicada sigue sirviendo mientras se construye la nueva en DB_TMP_PATH
+    borrar_temporal()
+    generacion = siguiente_generacion()
+    conn = abrir_db_carga()
+    with EscrituraBuild(perfil, conn, 'escribir en DB', generacion) as build:
         cur = conn.cursor()
 
         # ---- Tabla NORMAL (Para detalles) ----
-        cur.execute("DROP TABLE IF EXISTS inventario_plain;")
-        # Volvemos a añadir 'Clasificacion'
-        cur.execute("CREATE TABLE inventario_plain (Codigo TEXT, Descripcion TEXT, DescProd2 TEXT, Existencia TEXT, Clasificacion TEXT, Sucursal TEXT);")
-        cur.executemany(
-            "INSERT INTO inventario_plain (Codigo, Descripcion, DescProd2, Existencia, Clasificacion, Sucursal) VALUES (?, ?, ?, ?, ?, ?);",
-            final_data[["Codigo", "Descripcion", "DescProd2", "Existencia", "Clasificacion", "Sucursal"]].values.tolist()
-        )
+        with perfil.fase('carga_inventario_plain') as fase:
+            cur.execute("DROP TABLE IF EXISTS inventario_plain;")
+            # Volvemos a añadir 'Clasificacion'
+            cur.execute(CREATE_PLAIN)
+            # Ordenadas por código: el índice se construye sobre datos ya ordenados
+            # y las filas de un mismo código quedan juntas en disco.
+            # Se alimenta con un iterador sobre las columnas, sin armar la lista de filas.
+            ordenadas = final_data.sort_values(['Codigo', 'Sucursal'], kind='stable')
+            cur.executemany(INSERT_PLAIN, zip(*(ordenadas[c].tolist() for c in COLUMNAS_PLAIN)))
+            del ordenadas
+            fase['filas'] = len(final_data)
         print("   INFO: Tabla 'inventario_plain' creada y poblada.")
-        
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_inv_cod  ON inventario_plain(Codigo);")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_inv_suc  ON inventario_plain(Sucursal);")
-        print("   INFO: Índices creados para 'inventario_plain'.")
 
-        # ---- Tabla FTS5 (Para búsqueda rápida) ----
-        cur.execute("DROP TABLE IF EXISTS inventario;")
-        cur.execute("CREATE VIRTUAL TABLE inventario USING fts5(Codigo, Descripcion, DescProd2, content='');")
-        
-        unique_products = final_data[final_data['Sucursal'] == 'Global'][['Codigo', 'Descripcion', 'DescProd2']].drop_duplicates().values.tolist()
-        cur.executemany("INSERT INTO inventario (Codigo, Descripcion, DescProd2) VALUES (?, ?, ?);", unique_products)
-        print("   INFO: Tabla FTS 'inventario' creada y poblada.")
+        with perfil.fase('indices_y_fts'):
+            crear_indices_y_fts(cur, perfil)
 
-        conn.commit()
-        print("\n✅ Base de datos creada y guardada correctamente.")
+        guardar_huellas(cur, huellas)
+        guardar_generacion(cur, generacion, 'completo')
 
-    except sqlite3.Error as e:
-        print(f"❌ ERROR SQLite: {e}")
-        conn.rollback()
-    except Exception as e:
-        print(f"❌ ERROR General al escribir en DB: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
+        if build.publicar():
+            print(f"\n✅ Base de datos creada y publicada correctamente (generación {generacion}).")
+
+
+# --- BUILD INCREMENTAL ---
+
+def recalcular_global(cur, codigos):
+    """
+    Recalcula las filas 'Global' (con sus productos, entradas FTS y filas en 'existencias')
+    solo para los códigos dados, con la misma semántica que el build completo: textos
+    de la primera sucursal en orden alfabético y suma de las existencias sin redondear.
+    """
+    cur.execute("DROP TABLE IF EXISTS temp.codigos_afectados;")
+    cur.execute("CREATE TEMP TABLE codigos_afectados (Codigo TEXT PRIMARY KEY);")
+    cur.executemany("INSERT OR IGNORE INTO codigos_afectados (Codigo) VALUES (?);", ((c,) for c in codigos))
+
+    # Borrar las entradas FTS viejas (con external content hay que pasar los valores indexados)
+    viejos = cur.execute(
+        "SELECT p.id, p.Codigo, p.Descripcion, p.DescProd2 FROM productos p "
+        "JOIN codigos_afectados a ON a.Codigo = p.Codigo;"
+    ).fetchall()
+    cur.executemany(
+        "INSERT INTO inventario (inventario, rowid, Codigo, Descripcion, DescProd2) VALUES ('delete', ?, ?, ?, ?);",
+        viejos
+    )
+    cur.executemany(
+        "INSERT INTO productos_trigrama (productos_trigrama, rowid, Codigo, DescProd2) VALUES ('delete', ?, ?, ?);",
+        ((r[0], r[1], r[3]) for r in viejos)
+    )
+    cur.executemany("DELETE FROM productos WHERE id = ?;", ((r[0],) for r in viejos))
+    cur.execute(
+        "DELETE FROM inventario_plain WHERE Sucursal = 'Global' "
+        "AND Codigo IN (SELECT Codigo FROM codigos_afectados);"
+    )
+    cur.execute("DELETE FROM existencias WHERE Codigo IN (SELECT Codigo FROM codigos_afectados);")
+
+    filas = cur.execute(
+        "SELECT p.Codigo, p.Descripcion, p.DescProd2, p.Clasificacion, p.ExistenciaNum FROM inventario_plain p "
+        "JOIN codigos_afectados a ON a.Codigo = p.Codigo ORDER BY p.Codigo, p.Sucursal;"
+    ).fetchall()
+
+    nuevas = 0
+    for codigo, grupo in itertools.groupby(filas, key=lambda r: r[0]):
+        grupo = list(grupo)
+        primera = grupo[0]
+        existencia = math.fsum(r[4] for r in grupo)
+        cur.execute(INSERT_PLAIN, (codigo, primera[1], primera[2], str(int(round(existencia))), primera[3], 'Global', existencia))
+        cur.execute("INSERT INTO productos (Codigo, Descripcion, DescProd2) VALUES (?, ?, ?);", (codigo, primera[1], primera[2]))
+        producto_id = cur.lastrowid
+        cur.execute(
+            "INSERT INTO inventario (rowid, Codigo, Descripcion, DescProd2) VALUES (?, ?, ?, ?);",
+            (producto_id, codigo, primera[1], primera[2])
+        )
+        cur.execute(
+            "INSERT INTO productos_trigrama (rowid, Codigo, DescProd2) VALUES (?, ?, ?);",
+            (producto_id, codigo, primera[2])
+        )
+        nuevas += 1
+
+    crear_tabla_existencias(cur, "WHERE Codigo IN (SELECT Codigo FROM codigos_afectados)")
+    cur.execute("DROP TABLE temp.codigos_afectados;")
+    return nuevas
+
+def main_incremental(workers=None, herramienta=None):
+    print("=" * 60)
+    print(" BUSCADOR DE INVENTARIO (modo incremental)")
+    print("=" * 60)
+
+    if not os.path.exists(DB_PATH):
+        print(f"   INFO: No existe '{DB_PATH}'. Se hace un build completo.")
+        return main(workers, herramienta)
+
+    origen = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+    huellas_previas = leer_huellas(origen)
+    if huellas_previas is None:
+        origen.close()
+        print(f"   INFO: '{DB_PATH}' no tiene huellas de archivos. Se hace un build completo.")
+        return main(workers, herramienta)
+
+    perfil = PerfilBuild('incremental', herramienta)
+    if herramienta:
+        workers = 1  # Los perfiladores solo ven el proceso principal
+
+    # --- [1/3] DETECTANDO CAMBIOS ---
+    print(f"[1/3] Comparando huellas de {', '.join(SUCURSALES_FILES)}...")
+    cambios = {}     # {SUC: huella nueva, o None si el archivo desapareció}
+    solo_mtime = {}  # Mismo contenido con otro mtime: solo hay que actualizar la huella
+    with perfil.fase('deteccion'):
+        for suc_code in SUCURSALES_FILES:
+            suc = suc_code.upper()
+            file_path = f"{suc_code}.csv"
+            anterior = huellas_previas.get(suc)
+            if not os.path.exists(file_path):
+                if anterior is not None:
+                    cambios[suc] = None
+                continue
+            huella = huella_archivo(file_path, anterior)
+            if anterior is None or huella[2] != anterior[2]:
+                cambios[suc] = huella
+            elif huella != anterior:
+                solo_mtime[suc] = huella
+
+    if not cambios:
+        origen.close()
+        # Si solo cambió el mtime no se toca la DB publicada (nunca se escribe en
+        # su lugar): la próxima vez huella_archivo vuelve a calcular el hash y
+        # sigue viendo el mismo contenido.
+        print("✅ Ningún archivo cambió. La base de datos ya está al día.")
+        return
+
+    print(f"   INFO: Sucursales con cambios: {', '.join(cambios)}")
+
+    # Se trabaja sobre una copia de la DB publicada, que se renombra al final
+    borrar_temporal()
+    conn = sqlite3.connect(DB_TMP_PATH)
+    with perfil.fase('copia_db'):
+        origen.backup(conn)
+    origen.close()
+    with EscrituraBuild(perfil, conn, 'actualizar la DB', compactar=False) as build:
+        if solo_mtime:
+            guardar_huellas(conn.cursor(), solo_mtime)
+
+        # --- [2/3] RELEYENDO SUCURSALES CAMBIADAS ---
+        print("\n[2/3] Releyendo sucursales con cambios...")
+        nuevos = {}
+        for suc, huella in cambios.items():
+            if huella is None:
+                print(f"⚠️  WARN: '{suc.lower()}.csv' ya no existe. Se eliminan sus registros.")
+                nuevos[suc] = None
+        releer = [suc.lower() for suc, huella in cambios.items() if huella is not None]
+        with perfil.fase('lectura') as fase:
+            for suc_code, df in leer_sucursales(releer, workers):
+                registrar_lectura(perfil, suc_code, df)
+                suc = suc_code.upper()
+                if df is None:
+                    # Error de lectura: se conservan los datos anteriores y la huella vieja
+                    print(f"⚠️  WARN: Se conservan los datos anteriores de {suc}.")
+                    continue
+                nuevos[suc] = formatear_filas(agrupar_por_sucursal(df))
+            fase['filas'] = perfil.filas.get('filas_leidas', 0)
+
+        if not nuevos:
+            print("❌ No se pudo releer ninguna sucursal con cambios.")
+            return
+
+        # --- [3/3] ACTUALIZANDO DB ---
+        print(f"\n[3/3] Actualizando base de datos SQLite ('{DB_PATH}')...")
+        cur = conn.cursor()
+        afectados = set()
+        with perfil.fase('actualizacion') as fase:
+            fase['filas'] = 0
+            for suc, data in nuevos.items():
+                # Diferencia fila a fila contra lo que ya hay en la DB para esta sucursal
+                anteriores = {
+                    row[0]: row for row in cur.execute(
+                        "SELECT Codigo, Descripcion, DescProd2, Existencia, Clasificacion, Sucursal, ExistenciaNum "
+                        "FROM inventario_plain WHERE Sucursal = ?;", (suc,)
+                    )
+                }
+                filas = [] if data is None else [tuple(r) for r in data[COLUMNAS_PLAIN].values.tolist()]
+                cambiadas = [r for r in filas if anteriores.pop(r[0], None) != r]
+                borradas = list(anteriores)
+
+                cur.executemany(
+                    "DELETE FROM inventario_plain WHERE Codigo = ? AND Sucursal = ?;",
+                    [(c, suc) for c in itertools.chain(borradas, (r[0] for r in cambiadas))]
+                )
+                cur.executemany(INSERT_PLAIN, cambiadas)
+                afectados.update(borradas)
+                afectados.update(r[0] for r in cambiadas)
+                print(f"   INFO: {suc}: {len(cambiadas)} registros nuevos o modificados, {len(borradas)} eliminados.")
+                fase['filas'] += len(cambiadas) + len(borradas)
+
+        with perfil.fase('recalculo_global') as fase:
+            nuevas = recalcular_global(cur, afectados)
+            fase['filas'] = len(afectados)
+        print(f"   INFO: Global recalculado para {len(afectados)} códigos ({nuevas} filas).")
+        with perfil.fase('resumen'):
+            crear_tabla_resumen(cur)
+
+        guardar_huellas(cur, {suc: cambios[suc] for suc in nuevos if cambios[suc] is not None})
+        cur.executemany(f"DELETE FROM {META_TABLE} WHERE Sucursal = ?;", [(suc,) for suc in nuevos if cambios[suc] is None])
+        build.generacion = generacion = leer_generacion(conn) + 1
+        guardar_generacion(cur, generacion, 'incremental')
+
+        if build.publicar():
+            print(f"\n✅ Base de datos actualizada y publicada correctamente (generación {generacion}).")
+
+
+# --- BUILD STREAMING (sin pandas) ---
+
+# Textos que pandas.read_csv toma como vacíos (NaN) por defecto. El lector
+# streaming los trata igual para que ambos modos generen la misma DB.
+VALORES_NA = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+])
+RE_NO_NUMERICO = re.compile(r"[^0-9.-]")
+RE_NUMERO = re.compile(PATRON_NUMERO)
+
+def texto_csv(value):
+    """Equivalente de clean_text para un solo valor leído con el módulo csv."""
+    return "" if value is None or value in VALORES_NA else value.strip()
+
+def existencia_csv(value):
+    """Equivalente de clean_existence para un solo valor. Devuelve (existencia, es_invalido)."""
+    if value is None or value in VALORES_NA:
+        return 0.0, False
+    cleaned_text = RE_NO_NUMERICO.sub("", value.strip())
+    if RE_NUMERO.fullmatch(cleaned_text):
+        return float(cleaned_text), False
+    return 0.0, cleaned_text not in ('-', '.', '-.')
+
+def filas_sucursal_csv(suc_code, stats):
+    """
+    Generador de filas limpias (Codigo, Sucursal, Orden, Descripcion, DescProd2,
+    Clasificacion, Existencia) leídas del CSV de la sucursal línea por línea.
+    'Orden' es la posición en el archivo y sirve para reproducir el 'first' de pandas.
+    Acumula en stats las filas leídas, descartadas y existencias inválidas.
+    """
+    suc = suc_code.upper()
+    with open(f"{suc_code}.csv", newline='', encoding='latin1') as f:
+        # Con el formato ancho, csv.reader partiría cada línea en ~150 campos
+        # vacíos: se recortan las comas de relleno antes de tokenizar.
+        primera = f.readline()
+        relleno = columnas_relleno(primera)
+        lineas = itertools.chain([primera], f)
+        if relleno:
+            print(f"   INFO: {suc_code}.csv trae {relleno} columnas vacías de relleno; se ignoran.")
+            lineas = sin_relleno(lineas, relleno)
+        lector = csv.reader(lineas)
+        encabezado = next(lector, [])
+        try:
+            pos = {k: encabezado.index(v) for k, v in COL_NOMBRES_CSV.items()}
+        except ValueError:
+            faltantes = [v for v in COL_NOMBRES_CSV.values() if v not in encabezado]
+            raise ValueError(f"Faltan columnas en el encabezado: {faltantes}")
+        ancho = max(pos.values()) + 1
+
+        for orden, fila in enumerate(lector):
+            if not fila:
+                continue  # pandas salta las líneas en blanco
+            if len(fila) < ancho:
+                fila = fila + [None] * (ancho - len(fila))
+            stats['leidas'] += 1
+            existencia, invalido = existencia_csv(fila[pos['Existencia']])
+            if invalido:
+                stats['invalidas'] += 1
+            codigo = texto_csv(fila[pos['Codigo']])
+            if not codigo:
+                stats['descartadas'] += 1
+                continue
+            yield (
+                codigo, suc, orden,
+                texto_csv(fila[pos['Descripcion']]),
+                texto_csv(fila[pos['DescProd2']]),
+                texto_csv(fila[pos['Clasificacion']]) or 'S/M',
+                existencia,
+            )
+
+class FSum:
+    """Agregado SQL con math.fsum: suma exacta, independiente del orden de las filas."""
+    def __init__(self):
+        self.valores = []
+
+    def step(self, value):
+        self.valores.append(value)
+
+    def finalize(self):
+        return math.fsum(self.valores)
+
+def redondear_existencia(value):
+    """Mismo redondeo que el build con pandas (round(0), mitad a par) guardado como texto."""
+    return str(int(round(value)))
+
+def main_streaming(herramienta=None):
+    """
+    Build completo sin pandas y con memoria acotada: los CSV se leen línea por
+    línea con el módulo csv, se cargan a una tabla temporal de SQLite mediante
+    generadores, y la agrupación por sucursal y Global se hace en SQL.
+    """
+    print("=" * 60)
+    print(" BUSCADOR DE INVENTARIO (modo streaming)")
+    print("=" * 60)
+
+    perfil = PerfilBuild('streaming', herramienta)
+
+    borrar_temporal()
+    generacion = siguiente_generacion()
+    # Con journal en memoria para que funcionen los SAVEPOINT por archivo, y con
+    # la caché y los temporales por defecto para no perder la memoria acotada.
+    conn = abrir_db_carga(journal='MEMORY', cache_kib=None, temp_en_memoria=False)
+    conn.create_aggregate('fsum', 1, FSum)
+    conn.create_function('redondear', 1, redondear_existencia, deterministic=True)
+    with EscrituraBuild(perfil, conn, 'escribir en DB', generacion) as build:
+        cur = conn.cursor()
+
+        # --- [1/3] LEYENDO ARCHIVOS CSV A STAGING ---
+        print(f"[1/3] Leyendo archivos {', '.join(SUCURSALES_FILES)} a la tabla temporal...")
+        cur.execute(
+            "CREATE TEMP TABLE staging (Codigo TEXT, Sucursal TEXT, Orden INTEGER, "
+            "Descripcion TEXT, DescProd2 TEXT, Clasificacion TEXT, Existencia REAL);"
+        )
+        huellas = {}
+        total = 0
+        for suc_code in SUCURSALES_FILES:
+            file_path = f"{suc_code}.csv"
+            if not os.path.exists(file_path):
+                print(f"⚠️  WARN: No se encontró el archivo '{file_path}'. Saltando sucursal.")
+                continue
+            print(f" - Leyendo archivo: {file_path} (Sucursal: {suc_code.upper()}) ...")
+            huella = huella_archivo(file_path)
+            stats = {'leidas': 0, 'descartadas': 0, 'invalidas': 0}
+            cur.execute("SAVEPOINT archivo;")
+            try:
+                with perfil.fase(f"lectura/{file_path}") as fase:
+                    cur.executemany(
+                        "INSERT INTO staging (Codigo, Sucursal, Orden, Descripcion, DescProd2, Clasificacion, Existencia) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?);",
+                        filas_sucursal_csv(suc_code, stats)
+                    )
+                    fase['filas'] = stats['leidas']
+            except Exception as e:
+                cur.execute("ROLLBACK TO archivo;")
+                cur.execute("RELEASE archivo;")
+                print(f"❌ Error procesando el archivo {file_path}: {e}")
+                print("   ASEGÚRATE DE QUE LOS NOMBRES DE ENCABEZADO SEAN: cve_prod, desc_prod, Inv, desc_prod2, Clasificacion")
+                continue
+            cur.execute("RELEASE archivo;")
+
+            perfil.archivos[file_path] = {
+                'filas_leidas': stats['leidas'],
+                'descartadas_sin_codigo': stats['descartadas'],
+                'existencias_invalidas': stats['invalidas'],
+                'bytes': huella[0],
+            }
+            for clave, valor in perfil.archivos[file_path].items():
+                if clave != 'bytes':
+                    perfil.filas[clave] = perfil.filas.get(clave, 0) + valor
+            validas = stats['leidas'] - stats['descartadas']
+            if stats['descartadas']:
+                print(f"   INFO: Se descartaron {stats['descartadas']} filas sin código.")
+            if stats['invalidas']:
+                print(f"   WARN: {stats['invalidas']} existencias no se pudieron convertir a número y se tomaron como 0.")
+            if validas == 0:
+                print(f"   INFO: No se encontraron datos válidos en el archivo {file_path}.")
+                continue
+            huellas[suc_code.upper()] = huella
+            total += validas
+            print(f"   INFO: Leídos {validas} registros válidos.")
+
+        if not huellas:
+            print("❌ No se pudieron leer datos válidos de ningún archivo CSV.")
+            return
+        print(f"✅ Total archivos leídos: {len(huellas)}")
+        print(f"✅ Total registros leídos de todos los CSV: {total}")
+
+        # --- [2/3] AGRUPANDO EN SQL ---
+        print("\n[2/3] Agrupando datos y calculando Global en SQLite...")
+        with perfil.fase('agrupacion_sucursal') as fase:
+            cur.execute("CREATE INDEX temp.idx_staging ON staging(Codigo, Sucursal, Orden);")
+            cur.execute(CREATE_PLAIN)
+            # Con un solo MIN() en la consulta, SQLite toma las columnas sueltas de la
+            # fila con el mínimo: eso reproduce el 'first' de pandas (primera fila del
+            # archivo por código y sucursal; primera sucursal en orden alfabético para Global).
+            cur.execute(
+                "INSERT INTO inventario_plain (Codigo, Descripcion, DescProd2, Existencia, Clasificacion, Sucursal, ExistenciaNum) "
+                "SELECT Codigo, Descripcion, DescProd2, redondear(Suma), Clasificacion, Sucursal, Suma FROM ("
+                "  SELECT Codigo, Sucursal, MIN(Orden), Descripcion, DescProd2, Clasificacion, fsum(Existencia) AS Suma"
+                "  FROM staging GROUP BY Codigo, Sucursal ORDER BY Codigo, Sucursal"
+                ");"
+            )
+            fase['filas'] = total
+            cur.execute("DROP TABLE temp.staging;")
+        with perfil.fase('agregacion_global') as fase:
+            cur.execute(
+                "INSERT INTO inventario_plain (Codigo, Descripcion, DescProd2, Existencia, Clasificacion, Sucursal, ExistenciaNum) "
+                "SELECT Codigo, Descripcion, DescProd2, redondear(Suma), Clasificacion, 'Global', Suma FROM ("
+                "  SELECT Codigo, MIN(Sucursal), Descripcion, DescProd2, Clasificacion, fsum(ExistenciaNum) AS Suma"
+                "  FROM inventario_plain GROUP BY Codigo ORDER BY Codigo"
+                ");"
+            )
+            fase['filas'] = cur.rowcount
+            perfil.filas['codigos'] = cur.rowcount
+        finales = cur.execute("SELECT COUNT(*) FROM inventario_plain").fetchone()[0]
+        perfil.filas['finales'] = finales
+        print(f"✅ Total de registros finales para DB: {finales}")
+
+        # --- [3/3] ÍNDICES, FTS Y PUBLICACIÓN ---
+        print(f"\n[3/3] Construyendo índices y FTS ('{DB_PATH}')...")
+        with perfil.fase('indices_y_fts'):
+            crear_indices_y_fts(cur, perfil)
+        guardar_huellas(cur, huellas)
+        guardar_generacion(cur, generacion, 'streaming')
+
+        if build.publicar():
+            print(f"\n✅ Base de datos creada y publicada correctamente (generación {generacion}).")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Construye el índice SQLite del inventario a partir de los CSV de sucursales.")
+    parser.add_argument(
+        '--incremental', action='store_true',
+        help="Solo reingiere las sucursales cuyos CSV cambiaron desde el último build."
+    )
+    parser.add_argument(
+        '--workers', type=int, default=BUILD_WORKERS,
+        help="Procesos para leer los CSV en paralelo (por defecto uno por núcleo; 1 = en serie)."
+    )
+    parser.add_argument(
+        '--streaming', action='store_true',
+        help="Build completo sin pandas y con memoria acotada (lectura línea por línea y agrupación en SQL)."
+    )
+    parser.add_argument(
+        '--perfil', choices=['cprofile', 'tracemalloc'],
+        help="Agrega al reporte del build los puntos calientes de CPU (cProfile) o de memoria (tracemalloc)."
+    )
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    if args.incremental:
+        main_incremental(args.workers, args.perfil)
+    elif args.streaming:
+        main_streaming(args.perfil)
+    else:
+        main(args.workers, args.perfil)
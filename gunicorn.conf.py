@@ -0,0 +1,57 @@
+"""
+Configuración de gunicorn para producción (se carga sola al ejecutar
+`gunicorn app:app` desde la raíz del repo).
+
+Variables de entorno:
+    PORT                  Puerto (por defecto 8000)
+    GUNICORN_WORKER_CLASS sync | gthread | gevent (por defecto gthread; gevent
+                          requiere `pip install gevent`)
+    WEB_CONCURRENCY       Número de workers (por defecto se calcula de los núcleos)
+    GUNICORN_THREADS      Hilos por worker con gthread (por defecto 4)
+"""
+import multiprocessing
+import os
+
+NUCLEOS = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+
+# sync: un proceso por petición en curso, el doble de núcleos más uno.
+# gthread: SQLite suelta el GIL durante las consultas, así que unos pocos hilos
+#   por worker aprovechan el núcleo mientras otro hilo espera.
+# gevent: un worker por núcleo basta; cada worker atiende muchas conexiones.
+#   Ojo: las consultas SQLite bloquean el loop y el pool de conexiones crece
+#   hasta el número de greenlets con una consulta en curso.
+if worker_class == 'sync':
+    workers = 2 * NUCLEOS + 1
+    threads = 1
+elif worker_class == 'gevent':
+    workers = NUCLEOS
+    threads = 1
+    worker_connections = 256
+else:
+    workers = NUCLEOS + 1
+    threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+workers = int(os.environ.get('WEB_CONCURRENCY', workers))
+
+# La app se importa una vez en el maestro (plantilla, recursos estáticos) y los
+# workers la heredan con fork. La conexión SQLite se abre después, en cada worker.
+preload_app = True
+
+keepalive = 5
+backlog = 2048
+timeout = 60
+graceful_timeout = 30
+
+accesslog = '-'
+errorlog = '-'
+
+def post_worker_init(worker):
+    """
+    Calienta la DB y la página principal antes de que el worker acepte peticiones:
+    una conexión por hilo, que los hilos del pool de gthread toman al atender.
+    """
+    from app import calentar
+    calentar(worker.cfg.threads)
+    worker.log.info("Worker %s calentado", worker.pid)
@@ -2,5 +2,5 @@
 echo =============================================
 echo BUSCADOR DE INVENTARIO - FERRETERÍA EL CEDRO
 echo =============================================
-python app_flask.py
+python app.py
 pause
@@ -0,0 +1,290 @@
+// --- Variables Globales ---
+// La lista de sucursales la inyecta el servidor en <body data-sucursales="...">
+const SUCURSALES_ORDEN = JSON.parse(document.body.dataset.sucursales);
+const searchInput = document.getElementById('search-input');
+const searchResults = document.getElementById('search-results');
+const detalleProducto = document.getElementById('detalle-producto');
+const leyendaClasificacion = document.getElementById('leyenda-clasificacion'); // <-- Re-agregado
+const searchButton = document.getElementById('search-button');
+const soloConExistencia = document.getElementById('solo-con-existencia');
+const sucursalCheckboxes = document.querySelectorAll('input[name="sucursal"]');
+let currentQuery = "";
+// Paginación de /search: cursor de la página siguiente y búsqueda a la que pertenece
+let siguienteCursor = null;
+let busquedaActual = "";
+let cargandoPagina = false;
+
+// --- Lógica de Búsqueda ---
+
+async function fetchSearch(query) {
+    if (query.length < 2) {
+        searchResults.innerHTML = '';
+        return;
+    }
+    currentQuery = query;
+    // Los filtros se aplican en el servidor: solo llegan productos con resultados en /detalle
+    const filtros = getFiltros();
+    const url = `/search?q=${encodeURIComponent(query)}&${filtros.query}`;
+    busquedaActual = url;
+    siguienteCursor = null;
+    try {
+        const response = await fetch(url);
+        const data = await response.json();
+        if (url !== busquedaActual) return; // Llegó tarde: ya se pidió otra búsqueda
+        if (data.error) {
+            searchResults.innerHTML = `<li style="color: red;">${data.error}</li>`;
+            return;
+        }
+        displaySearchResults(data, filtros.sucursales);
+    } catch (error) {
+        console.error('Error en fetchSearch:', error);
+        searchResults.innerHTML = '<li>Error al cargar resultados.</li>';
+    }
+}
+
+// Pide la página siguiente de la búsqueda actual (scroll infinito)
+async function fetchSiguientePagina() {
+    if (!siguienteCursor || cargandoPagina) return;
+    const url = busquedaActual;
+    cargandoPagina = true;
+    try {
+        const response = await fetch(`${url}&cursor=${encodeURIComponent(siguienteCursor)}`);
+        const data = await response.json();
+        if (url !== busquedaActual) return;
+        if (data.error) {
+            siguienteCursor = null;
+            actualizarMarcadorFinal(data.error);
+            return;
+        }
+        appendSearchResults(data, getFiltros().sucursales);
+    } catch (error) {
+        console.error('Error en fetchSiguientePagina:', error);
+    } finally {
+        cargandoPagina = false;
+    }
+}
+
+// Existencias por sucursal de un resultado ("HI 3 · EX 0 · ..."), sin pedir /detalle
+function resumenExistencias(existencias, sucursalesFiltro) {
+    const sucursales = sucursalesFiltro.length > 0 ? sucursalesFiltro : SUCURSALES_ORDEN;
+    return sucursales
+        .filter(suc => suc in existencias)
+        .map(suc => {
+            const clase = existencias[suc] < 0 ? ' class="existencia-negativa"' : '';
+            return `<span${clase}>${suc} ${existencias[suc]}</span>`;
+        })
+        .join(' · ');
+}
+
+function displaySearchResults(data, sucursalesFiltro) {
+    searchResults.innerHTML = '';
+    if (data.productos.length === 0) {
+        searchResults.innerHTML = '<li style="text-align: center; color: #777;">No se encontraron productos.</li>';
+        return;
+    }
+
+    const total = document.createElement('li');
+    total.className = 'total-resultados';
+    total.textContent = data.total_exacto
+        ? `${data.total} producto${data.total === 1 ? '' : 's'}`
+        : `Más de ${data.total} productos`;
+    searchResults.appendChild(total);
+    searchResults.scrollTop = 0;
+    appendSearchResults(data, sucursalesFiltro);
+}
+
+// Marcador al final de la lista: al hacerse visible se pide la página siguiente
+const marcadorFinal = document.createElement('li');
+marcadorFinal.className = 'marcador-final';
+const observadorFinal = new IntersectionObserver(entradas => {
+    if (entradas.some(e => e.isIntersecting)) fetchSiguientePagina();
+}, { root: searchResults, rootMargin: '200px' });
+
+function actualizarMarcadorFinal(texto) {
+    marcadorFinal.textContent = texto;
+    searchResults.appendChild(marcadorFinal); // Siempre al final, después de la última página
+    // Volver a observarlo avisa de nuevo si sigue visible (página que no llenó la lista)
+    observadorFinal.unobserve(marcadorFinal);
+    observadorFinal.observe(marcadorFinal);
+}
+
+function appendSearchResults(data, sucursalesFiltro) {
+    siguienteCursor = data.siguiente;
+
+    data.productos.forEach(producto => {
+        const li = document.createElement('li');
+        li.dataset.codigo = producto.Codigo;
+
+        li.innerHTML = `
+            <span class="codigo-aq">(${producto.DescProd2 || 'S/C'})</span>
+            <span class="codigo-b">${producto.Codigo}</span> – 
+            <span class="desc-d">${producto.Descripcion}</span>
+            <span class="existencias-resumen">${resumenExistencias(producto.existencias, sucursalesFiltro)}</span>
+        `;
+
+        li.addEventListener('click', () => {
+            fetchDetalle(producto.Codigo);
+            searchResults.style.display = 'none';
+            detalleProducto.style.display = 'block';
+            leyendaClasificacion.style.display = 'block'; // <-- Re-agregado
+            searchInput.value = producto.Codigo;
+        });
+        searchResults.appendChild(li);
+    });
+
+    if (siguienteCursor) {
+        actualizarMarcadorFinal('Cargando más resultados…');
+    } else {
+        marcadorFinal.remove();
+    }
+}
+
+// --- Lógica de Detalles ---
+
+async function fetchDetalle(codigo) {
+    try {
+        const filtros = getFiltros();
+        const response = await fetch(`/detalle?codigo=${encodeURIComponent(codigo)}&${filtros.query}`);
+        const data = await response.json();
+
+        if (data.error) {
+            detalleProducto.innerHTML = `<p style="color: red;">${data.error}</p>`;
+            return;
+        }
+
+        displayDetalleProducto(data, filtros.sucursales);
+
+    } catch (error) {
+        console.error('Error en fetchDetalle:', error);
+        detalleProducto.innerHTML = '<p style="color: red;">Error al cargar el detalle del producto.</p>';
+    }
+}
+
+function displayDetalleProducto(data, sucursalesFiltro) {
+    const sucursalesAMostrar = sucursalesFiltro.length > 0 ? sucursalesFiltro : SUCURSALES_ORDEN;
+
+    let ths = '';
+    let tdsExistencia = '';
+    let tdsClasificacion = ''; // <-- Re-agregado
+
+    sucursalesAMostrar.forEach(suc => {
+        const info = data.sucursales[suc] || { Existencia: 'N/A', Clasificacion: 'N/A' }; // <-- Re-agregado
+        let existenciaNum = parseInt(info.Existencia);
+        let existenciaStr = info.Existencia;
+
+        let claseExistencia = '';
+        if (!isNaN(existenciaNum) && existenciaNum < 0) {
+            claseExistencia = 'class="existencia-negativa"';
+        }
+
+        ths += `<th>${suc}</th>`;
+        tdsExistencia += `<td ${claseExistencia}>${existenciaStr}</td>`;
+        tdsClasificacion += `<td>${info.Clasificacion}</td>`; // <-- Re-agregado
+    });
+
+    let stockTotal = data.global.Existencia;
+    let stockTotalClase = parseInt(stockTotal) < 0 ? 'class="existencia-negativa"' : '';
+
+    // CAMBIO: Volver a agregar la fila de Clasificación
+    detalleProducto.innerHTML = `
+        <h3>Detalle: ${data.global.Descripcion}</h3>
+        <p><strong>Código (B):</strong> ${data.codigo_buscado}</p>
+        <p><strong>Código (AQ):</strong> ${data.global.DescProd2 || 'S/C'}</p>
+        <table class="tabla-existencias">
+            <thead>
+                <tr>
+                    <th></th>
+                    ${ths}
+                    <th>Stock Total</th>
+                </tr>
+            </thead>
+            <tbody>
+                <tr>
+                    <td><strong>EXISTENCIAS</strong></td>
+                    ${tdsExistencia}
+                    <td class="existencia-val ${stockTotalClase}">${stockTotal}</td>
+                </tr>
+                <tr>
+                    <td><strong>CLASIFICACIÓN</strong></td>
+                    ${tdsClasificacion}
+                    <td>${data.global.Clasificacion}</td>
+                </tr>
+            </tbody>
+        </table>
+    `;
+
+    detalleProducto.style.display = 'block';
+    leyendaClasificacion.style.display = 'block'; // <-- Re-agregado
+}
+
+// --- Lógica de Filtros ---
+
+function getFiltros() {
+    const soloExistencia = soloConExistencia.checked;
+    const sucursales = Array.from(sucursalCheckboxes)
+        .filter(cb => cb.checked)
+        .map(cb => cb.value);
+
+    let queryParts = [];
+    if (soloExistencia) {
+        queryParts.push('solo_existencia=true');
+    }
+    sucursales.forEach(suc => {
+        queryParts.push(`sucursal=${encodeURIComponent(suc)}`);
+    });
+
+    return {
+        query: queryParts.join('&'),
+        sucursales: sucursales
+    };
+}
+
+function applyFiltros() {
+    const codigoActual = searchInput.value;
+    if (detalleProducto.style.display === 'block' && codigoActual) {
+        fetchDetalle(codigoActual);
+    } else if (currentQuery) {
+        fetchSearch(currentQuery);
+    }
+}
+
+// --- Event Listeners ---
+
+let searchTimeout;
+searchInput.addEventListener('input', (e) => {
+    clearTimeout(searchTimeout);
+    if (e.target.value === '') {
+        searchResults.innerHTML = '';
+        detalleProducto.style.display = 'none';
+        leyendaClasificacion.style.display = 'none'; // <-- Re-agregado
+        searchResults.style.display = 'block';
+        return;
+    }
+
+    if (searchResults.style.display === 'none') {
+        searchResults.style.display = 'block';
+        detalleProducto.style.display = 'none';
+        leyendaClasificacion.style.display = 'none'; // <-- Re-agregado
+    }
+
+    searchTimeout = setTimeout(() => {
+        fetchSearch(e.target.value);
+    }, 300);
+});
+
+searchInput.addEventListener('keydown', (e) => {
+    if (e.key === 'Enter') {
+        clearTimeout(searchTimeout);
+        fetchSearch(searchInput.value);
+    }
+});
+
+searchButton.addEventListener('click', () => {
+    clearTimeout(searchTimeout);
+    fetchSearch(searchInput.value);
+});
+
+soloConExistencia.addEventListener('change', applyFiltros);
+sucursalCheckboxes.forEach(cb => {
+    cb.addEventListener('change', applyFiltros);
+});